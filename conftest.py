@@ -0,0 +1,46 @@
+"""
+Shared pytest fixtures for the AskYourDoc tests
+
+Integration tests need the backend on :8000 (and the frontend on :3000 for the frontend
+check). They are skipped when those servers are not running, so a plain `pytest` runs the
+offline unit tests on their own; `pytest -m "not integration"` leaves them out entirely.
+"""
+
+import pytest
+
+BACKEND_URL = "http://localhost:8000"
+FRONTEND_URL = "http://localhost:3000"
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "integration: needs the backend (and frontend) servers running")
+
+def skip_unless_reachable(http, url: str):
+    """Skip the requesting tests when no server answers at url"""
+    import requests
+    try:
+        http.get(url, timeout=2)
+    except requests.exceptions.RequestException:
+        pytest.skip(f"No server reachable at {url}")
+
+@pytest.fixture(scope="session")
+def http():
+    """One pooled HTTP session per test process, so checks reuse keep-alive connections"""
+    requests = pytest.importorskip("requests")
+    from requests.adapters import HTTPAdapter
+    
+    http = requests.Session()
+    http.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    yield http
+    http.close()
+
+@pytest.fixture(scope="session")
+def session(http):
+    """Pooled session for tests against the backend, skipped when it is not running"""
+    skip_unless_reachable(http, BACKEND_URL)
+    return http
+
+@pytest.fixture(scope="session")
+def frontend(http):
+    """Pooled session for tests against the frontend, skipped when it is not running"""
+    skip_unless_reachable(http, FRONTEND_URL)
+    return http
@@ -2,23 +2,26 @@
 Demo example showing how to use the AskYourDoc system
 """
 
-import json
+import sys
 from knowledge_base import MedicalKnowledgeBase
 from lab_report_processor import LabReportProcessor
 from health_analyzer import HealthAnalyzer
 
-def demo_biomarker_analysis():
-    """Demonstrate biomarker analysis without file upload"""
-    print("🏥 AskYourDoc Demo - Biomarker Analysis")
-    print("=" * 50)
-    
-    # Initialize components
+def build_knowledge_base() -> MedicalKnowledgeBase:
+    """Load datasets, reference data and embeddings once for all demos"""
     print("📊 Initializing Knowledge Base...")
     kb = MedicalKnowledgeBase()
     kb.load_datasets()
     kb.load_reference_data()
     kb.initialize_embeddings()
+    return kb
+
+def demo_biomarker_analysis(kb: MedicalKnowledgeBase):
+    """Demonstrate biomarker analysis without file upload"""
+    print("🏥 AskYourDoc Demo - Biomarker Analysis")
+    print("=" * 50)
     
+    # Initialize components
     print("🔬 Initializing Health Analyzer...")
     analyzer = HealthAnalyzer(kb)
     
@@ -62,82 +65,78 @@ def demo_biomarker_analysis():
         user_lifestyle=user_lifestyle
     )
     
-    # Display results
-    print(f"\n📋 ANALYSIS RESULTS")
-    print("=" * 50)
+    # Display results, buffered into a single write
+    out = []
+    out.append(f"\n📋 ANALYSIS RESULTS")
+    out.append("=" * 50)
     
     # Pillar 1: Biomarker Interpretation
-    print(f"\n1️⃣ {analysis['pillar_1_biomarker_interpretation']['title']}")
-    print("-" * 40)
+    out.append(f"\n1️⃣ {analysis['pillar_1_biomarker_interpretation']['title']}")
+    out.append("-" * 40)
     for biomarker, data in analysis['pillar_1_biomarker_interpretation']['biomarkers'].items():
-        print(f"• {biomarker.upper()}: {data['value']} ({data['status']})")
-        print(f"  Reference: {data['reference_range']}")
-        print(f"  Interpretation: {data['interpretation']}")
-        print()
+        out.append(f"• {biomarker.upper()}: {data['value']} ({data['status']})")
+        out.append(f"  Reference: {data['reference_range']}")
+        out.append(f"  Interpretation: {data['interpretation']}")
+        out.append("")
     
     # Pillar 2: Symptom Correlation
-    print(f"\n2️⃣ {analysis['pillar_2_symptom_correlation']['title']}")
-    print("-" * 40)
+    out.append(f"\n2️⃣ {analysis['pillar_2_symptom_correlation']['title']}")
+    out.append("-" * 40)
     if analysis['pillar_2_symptom_correlation']['correlations']:
         for correlation in analysis['pillar_2_symptom_correlation']['correlations']:
-            print(f"• {correlation['explanation']}")
+            out.append(f"• {correlation['explanation']}")
     else:
-        print("No specific correlations found between symptoms and biomarkers.")
+        out.append("No specific correlations found between symptoms and biomarkers.")
     
     # Pillar 3: Predictive Insights
-    print(f"\n3️⃣ {analysis['pillar_3_predictive_insights']['title']}")
-    print("-" * 40)
-    print(f"Overall Risk Level: {analysis['pillar_3_predictive_insights']['overall_risk_level'].upper()}")
+    out.append(f"\n3️⃣ {analysis['pillar_3_predictive_insights']['title']}")
+    out.append("-" * 40)
+    out.append(f"Overall Risk Level: {analysis['pillar_3_predictive_insights']['overall_risk_level'].upper()}")
     
     for risk in analysis['pillar_3_predictive_insights']['risk_assessments']:
-        print(f"\n• {risk['condition']} Risk: {risk['risk_level'].upper()}")
+        out.append(f"\n• {risk['condition']} Risk: {risk['risk_level'].upper()}")
         for factor in risk['risk_factors']:
-            print(f"  - {factor}")
+            out.append(f"  - {factor}")
     
     # Pillar 4: Recommendations
-    print(f"\n4️⃣ {analysis['pillar_4_actionable_recommendations']['title']}")
-    print("-" * 40)
+    out.append(f"\n4️⃣ {analysis['pillar_4_actionable_recommendations']['title']}")
+    out.append("-" * 40)
     
     if analysis['pillar_4_actionable_recommendations']['medical_consultation_required']:
-        print("🚨 MEDICAL CONSULTATION REQUIRED")
-        print("Immediate Actions:")
+        out.append("🚨 MEDICAL CONSULTATION REQUIRED")
+        out.append("Immediate Actions:")
         for action in analysis['pillar_4_actionable_recommendations']['immediate_actions']:
-            print(f"  - {action}")
-        print()
+            out.append(f"  - {action}")
+        out.append("")
     
-    print("Lifestyle Recommendations:")
+    out.append("Lifestyle Recommendations:")
     for rec in analysis['pillar_4_actionable_recommendations']['lifestyle_recommendations'][:5]:
-        print(f"  • {rec}")
+        out.append(f"  • {rec}")
     
-    print("\nMonitoring Recommendations:")
+    out.append("\nMonitoring Recommendations:")
     for rec in analysis['pillar_4_actionable_recommendations']['monitoring_recommendations'][:3]:
-        print(f"  • {rec}")
+        out.append(f"  • {rec}")
     
     # Contextual Knowledge Used
-    print(f"\n🧠 CONTEXTUAL KNOWLEDGE USED")
-    print("-" * 40)
+    out.append(f"\n🧠 CONTEXTUAL KNOWLEDGE USED")
+    out.append("-" * 40)
     total_insights = 0
     for biomarker, insights in analysis['contextual_knowledge_used'].items():
         if biomarker != 'general' and insights:
             total_insights += len(insights)
-            print(f"• {biomarker}: {len(insights)} insights")
+            out.append(f"• {biomarker}: {len(insights)} insights")
     
-    print(f"• General: {len(analysis['contextual_knowledge_used'].get('general', []))} insights")
-    print(f"Total contextual insights used: {total_insights + len(analysis['contextual_knowledge_used'].get('general', []))}")
+    out.append(f"• General: {len(analysis['contextual_knowledge_used'].get('general', []))} insights")
+    out.append(f"Total contextual insights used: {total_insights + len(analysis['contextual_knowledge_used'].get('general', []))}")
+    sys.stdout.write("\n".join(out) + "\n")
     
     return analysis
 
-def demo_knowledge_search():
+def demo_knowledge_search(kb: MedicalKnowledgeBase):
     """Demonstrate knowledge base search functionality"""
     print(f"\n🔍 KNOWLEDGE BASE SEARCH DEMO")
     print("=" * 50)
     
-    # Initialize knowledge base
-    kb = MedicalKnowledgeBase()
-    kb.load_datasets()
-    kb.load_reference_data()
-    kb.initialize_embeddings()
-    
     # Test queries
     queries = [
         "TSH hypothyroidism symptoms",
@@ -158,16 +157,11 @@ def demo_knowledge_search():
         else:
             print("  No results found")
 
-def demo_reference_ranges():
+def demo_reference_ranges(kb: MedicalKnowledgeBase):
     """Demonstrate reference ranges functionality"""
     print(f"\n📋 REFERENCE RANGES DEMO")
     print("=" * 50)
     
-    # Initialize knowledge base
-    kb = MedicalKnowledgeBase()
-    kb.load_datasets()
-    kb.load_reference_data()
-    
     # Show some reference ranges
     biomarkers = ["Hemoglobin", "TSH", "LDL Cholestrol", "Vitamin D"]
     
@@ -184,16 +178,19 @@ if __name__ == "__main__":
     print()
     
     try:
+        # Build the knowledge base once and share it across demos
+        kb = build_knowledge_base()
+        
         # Run demos
-        demo_reference_ranges()
-        demo_knowledge_search()
-        demo_biomarker_analysis()
+        demo_reference_ranges(kb)
+        demo_knowledge_search(kb)
+        demo_biomarker_analysis(kb)
         
         print(f"\n✅ Demo completed successfully!")
         print(f"\nTo run the full API server:")
         print(f"  python main.py")
-        print(f"\nTo run the test suite:")
-        print(f"  python test_system.py")
+        print(f"\nTo run the test suite against the running server:")
+        print(f"  pytest test_system.py")
         
     except Exception as e:
         print(f"❌ Demo failed: {e}")
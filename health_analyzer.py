@@ -2,16 +2,32 @@
 Health Analyzer for generating comprehensive health insights using RAG workflow
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Set, Tuple
 from knowledge_base import MedicalKnowledgeBase
 from lab_report_processor import LabReportProcessor
+from cache import LRUCache
+import copy
+import hashlib
 import json
+import re
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj: Any, sort_keys: bool = False) -> bytes:
+    """Serialize analysis data to JSON bytes, using orjson when it is installed"""
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, sort_keys=sort_keys).encode('utf-8')
+
 class HealthAnalyzer:
-    def __init__(self, knowledge_base: MedicalKnowledgeBase):
-        self.kb = knowledge_base
-        self.medical_disclaimer = """
+    MEDICAL_DISCLAIMER = """
 **IMPORTANT MEDICAL DISCLAIMER**
 
 This analysis is for informational purposes only and should not be considered as medical advice, diagnosis, or treatment recommendation. The information provided is based on general medical knowledge and data patterns, but individual health conditions can vary significantly.
@@ -26,44 +42,176 @@ This analysis is for informational purposes only and should not be considered as
 The insights provided are based on statistical patterns and general medical knowledge, but your specific health situation may differ. Only a licensed healthcare professional can provide proper medical diagnosis and treatment recommendations.
 """
     
+    SYMPTOM_KEYWORDS = {
+        'fatigue': ['tired', 'fatigue', 'exhausted', 'weak'],
+        'weight_changes': ['weight', 'gain', 'loss', 'obese'],
+        'mood_changes': ['depressed', 'anxious', 'mood', 'irritable'],
+        'digestive_issues': ['nausea', 'vomiting', 'diarrhea', 'constipation'],
+        'cardiovascular': ['chest', 'pain', 'heart', 'palpitations'],
+        'neurological': ['headache', 'dizziness', 'confusion', 'memory']
+    }
+    
+    # Every keyword as a named group inside a lookahead, so a single scan finds
+    # all substring hits (including overlapping ones) without lowercasing the text
+    SYMPTOM_PATTERN = re.compile(
+        '(?=' + '|'.join(f"(?P<{category}>{'|'.join(keywords)})" for category, keywords in SYMPTOM_KEYWORDS.items()) + ')',
+        re.IGNORECASE
+    )
+    
+    GLYCEMIC_MARKERS = frozenset({'glucose', 'hba1c'})
+    LIPID_MARKERS = frozenset({'total_cholesterol', 'ldl', 'hdl', 'triglycerides'})
+    THYROID_MARKERS = frozenset({'tsh'})
+    INFLAMMATION_MARKERS = frozenset({'crp', 'esr'})
+    VITAMIN_D_MARKERS = frozenset({'vitamin_d'})
+    
+    # Each risk assessor runs when the report contains any of its biomarkers and
+    # receives the top insights retrieved under its contextual knowledge key
+    RISK_ASSESSORS = (
+        (GLYCEMIC_MARKERS, '_assess_diabetes_risk', 'general'),
+        (LIPID_MARKERS, '_assess_cardiovascular_risk', 'general'),
+        (THYROID_MARKERS, '_assess_thyroid_risk', 'tsh'),
+        (INFLAMMATION_MARKERS, '_assess_inflammation_risk', 'general'),
+    )
+    
+    GENERAL_LIFESTYLE_RECOMMENDATIONS = (
+        "Maintain a balanced diet rich in fruits, vegetables, and whole grains",
+        "Engage in regular physical activity (at least 150 minutes per week)",
+        "Maintain a healthy weight",
+        "Avoid smoking and limit alcohol consumption",
+        "Get adequate sleep (7-9 hours per night)",
+    )
+    
+    # Extra recommendations added when the report contains any of the markers
+    LIFESTYLE_RECOMMENDATIONS = (
+        (GLYCEMIC_MARKERS, (
+            "Limit refined carbohydrates and sugary foods",
+            "Monitor carbohydrate intake and consider portion control",
+        )),
+        (LIPID_MARKERS, (
+            "Reduce saturated and trans fats in your diet",
+            "Increase intake of omega-3 fatty acids",
+            "Consider soluble fiber supplements",
+        )),
+        (THYROID_MARKERS, (
+            "Ensure adequate iodine intake through diet",
+            "Consider selenium-rich foods (Brazil nuts, fish)",
+        )),
+        (VITAMIN_D_MARKERS, (
+            "Get regular sun exposure (15-30 minutes daily)",
+            "Consider vitamin D supplementation if deficient",
+        )),
+    )
+    
+    GENERAL_MONITORING_RECOMMENDATIONS = (
+        "Schedule regular follow-up lab tests as recommended by your healthcare provider",
+        "Keep a record of your lab results to track trends over time",
+    )
+    
+    MONITORING_RECOMMENDATIONS = (
+        (GLYCEMIC_MARKERS, (
+            "Monitor blood glucose levels regularly if recommended by your doctor",
+            "Consider HbA1c testing every 3-6 months",
+        )),
+        (LIPID_MARKERS, (
+            "Monitor lipid profile every 6-12 months",
+        )),
+        (THYROID_MARKERS, (
+            "Monitor thyroid function tests every 6-12 months",
+        )),
+    )
+    
+    # Values at or above these thresholds require immediate medical attention
+    CRITICAL_THRESHOLDS = {
+        'glucose': 300,  # Very high glucose
+        'tsh': 20,       # Very high TSH
+        'creatinine': 3.0,  # High creatinine
+        'crp': 10.0      # Very high CRP
+    }
+    CRITICAL_FINDING_TEMPLATE = "CRITICAL: {biomarker} level of {value} requires immediate medical attention"
+    BATCH_KERNEL_MIN_PATIENTS = 16
+    
+    INTERPRETATION_TEMPLATE = "Your {biomarker} level is {value}, which is classified as {status}."
+    ASSOCIATION_TEMPLATE = "This pattern is associated with {condition}."
+    
+    def __init__(self, knowledge_base: MedicalKnowledgeBase):
+        self.kb = knowledge_base
+        self._knowledge_cache = LRUCache(maxsize=4096)
+        self._analysis_cache = LRUCache(maxsize=512)
+        self._executor = ThreadPoolExecutor(max_workers=4)
+    
     def analyze_health_report(self, 
                             biomarker_data: Dict[str, float], 
                             user_symptoms: str = "", 
-                            user_lifestyle: str = "") -> Dict[str, Any]:
+                            user_lifestyle: str = "",
+                            retrieve_context: bool = True) -> Dict[str, Any]:
         """
         Perform comprehensive health analysis using the Four Pillars approach
+        
+        With retrieve_context=False the embedding and vector search are skipped and the
+        pillars are built from the rule-based analysis alone.
         """
+        # Analyses are deterministic in their inputs, so identical requests reuse the cached result.
+        # Callers only ever get deep copies, so mutating a result cannot corrupt later hits
+        cache_key = self._analysis_cache_key(biomarker_data, user_symptoms, user_lifestyle, retrieve_context)
+        cached_analysis = self._analysis_cache.get(cache_key)
+        if cached_analysis is not None:
+            analysis = copy.deepcopy(cached_analysis)
+            analysis['timestamp'] = datetime.now().isoformat()
+            return analysis
         
-        # Retrieve contextual knowledge for all biomarkers
-        contextual_knowledge = self._retrieve_contextual_knowledge(biomarker_data)
+        # Retrieve contextual knowledge for all biomarkers in the background
+        retrieval = None
+        if retrieve_context:
+            retrieval = self._executor.submit(self._retrieve_contextual_knowledge, biomarker_data)
+        
+        # Preprocess the inputs that don't depend on retrieval while it runs
+        symptom_analysis = self._analyze_symptoms(user_symptoms)
+        critical_findings = self._identify_critical_findings(biomarker_data)
+        contextual_knowledge = retrieval.result() if retrieval is not None else {}
+        
+        # Perform Four Pillars analysis; the pillars only read their inputs, so they run concurrently
+        pillars = {
+            'pillar_1_biomarker_interpretation': self._executor.submit(self._analyze_biomarkers, biomarker_data, contextual_knowledge),
+            'pillar_2_symptom_correlation': self._executor.submit(self._correlate_symptoms_biomarkers, biomarker_data, symptom_analysis, contextual_knowledge),
+            'pillar_3_predictive_insights': self._executor.submit(self._generate_predictive_insights, biomarker_data, contextual_knowledge),
+            'pillar_4_actionable_recommendations': self._executor.submit(self._generate_recommendations, biomarker_data, critical_findings, user_lifestyle, contextual_knowledge)
+        }
         
-        # Perform Four Pillars analysis
         analysis = {
-            'disclaimer': self.medical_disclaimer,
+            'disclaimer': self.MEDICAL_DISCLAIMER,
             'timestamp': datetime.now().isoformat(),
-            'pillar_1_biomarker_interpretation': self._analyze_biomarkers(biomarker_data, contextual_knowledge),
-            'pillar_2_symptom_correlation': self._correlate_symptoms_biomarkers(biomarker_data, user_symptoms, contextual_knowledge),
-            'pillar_3_predictive_insights': self._generate_predictive_insights(biomarker_data, contextual_knowledge),
-            'pillar_4_actionable_recommendations': self._generate_recommendations(biomarker_data, user_symptoms, user_lifestyle, contextual_knowledge),
+            **{name: future.result() for name, future in pillars.items()},
             'contextual_knowledge_used': contextual_knowledge
         }
         
-        return analysis
+        self._analysis_cache.put(cache_key, analysis)
+        return copy.deepcopy(analysis)
+    
+    def _analysis_cache_key(self, biomarker_data: Dict[str, float], user_symptoms: str, user_lifestyle: str,
+                            retrieve_context: bool) -> str:
+        """Stable content hash of the analysis inputs"""
+        payload = dumps([biomarker_data, user_symptoms, user_lifestyle, retrieve_context], sort_keys=True)
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
     
     def _retrieve_contextual_knowledge(self, biomarker_data: Dict[str, float]) -> Dict[str, List[Dict]]:
         """Retrieve relevant contextual knowledge for each biomarker"""
-        contextual_knowledge = {}
-        
-        for biomarker, value in biomarker_data.items():
-            # Create query for this biomarker
-            query = f"{biomarker} {value} biomarker analysis"
-            knowledge = self.kb.retrieve_contextual_knowledge(query, top_k=3)
-            contextual_knowledge[biomarker] = knowledge
+        # Values are bucketed to one decimal so near-identical reports share cached results
+        queries = {biomarker: f"{biomarker} {round(value, 1)} biomarker analysis" for biomarker, value in biomarker_data.items()}
         
         # Also get general health insights
-        general_query = "health risk assessment biomarker patterns"
-        general_knowledge = self.kb.retrieve_contextual_knowledge(general_query, top_k=5)
-        contextual_knowledge['general'] = general_knowledge
+        queries['general'] = "health risk assessment biomarker patterns"
+        
+        contextual_knowledge = {name: self._knowledge_cache.get(query) for name, query in queries.items()}
+        missing = [name for name, knowledge in contextual_knowledge.items() if knowledge is None]
+        
+        if missing:
+            # One batched search at the general top_k; biomarker rows keep their top 3
+            results = self.kb.retrieve_contextual_knowledge_batch([queries[name] for name in missing], top_k=5)
+            for name, knowledge in zip(missing, results):
+                knowledge = tuple(knowledge if name == 'general' else knowledge[:3])
+                contextual_knowledge[name] = knowledge
+                if self.kb.vector_index is not None:
+                    self._knowledge_cache.put(queries[name], knowledge)
         
         return contextual_knowledge
     
@@ -74,13 +222,14 @@ The insights provided are based on statistical patterns and general medical know
             'biomarkers': {}
         }
         
-        for biomarker, value in biomarker_data.items():
+        # Classify all biomarkers against their pre-parsed reference bounds in one call
+        values = np.fromiter(biomarker_data.values(), dtype=float, count=len(biomarker_data))
+        statuses = self.kb.classify_values(list(biomarker_data), values).tolist()
+        
+        for (biomarker, value), status in zip(biomarker_data.items(), statuses):
             # Get reference range
             reference_range = self.kb.get_biomarker_reference_range(biomarker)
             
-            # Classify status
-            status = self._classify_biomarker_status(biomarker, value, reference_range)
-            
             # Get contextual insights
             biomarker_knowledge = contextual_knowledge.get(biomarker, [])
             
@@ -94,22 +243,25 @@ The insights provided are based on statistical patterns and general medical know
         
         return analysis
     
-    def _correlate_symptoms_biomarkers(self, biomarker_data: Dict[str, float], user_symptoms: str, contextual_knowledge: Dict) -> Dict[str, Any]:
+    def _correlate_symptoms_biomarkers(self, biomarker_data: Dict[str, float], symptom_analysis: Dict[str, Any], contextual_knowledge: Dict) -> Dict[str, Any]:
         """Pillar 2: Correlation Between Symptoms and Biomarker Trends"""
         analysis = {
             'title': 'Correlation Between Symptoms and Biomarker Trends',
             'correlations': [],
-            'symptom_analysis': self._analyze_symptoms(user_symptoms)
+            'symptom_analysis': symptom_analysis
         }
         
-        if not user_symptoms.strip():
+        if not symptom_analysis['symptoms_provided']:
             analysis['note'] = 'No symptoms provided for correlation analysis'
             return analysis
         
+        # Symptoms are parsed once and shared by every biomarker
+        detected = set(symptom_analysis['detected_categories'])
+        
         # Find correlations between symptoms and biomarkers
         for biomarker, value in biomarker_data.items():
             biomarker_knowledge = contextual_knowledge.get(biomarker, [])
-            correlation = self._find_symptom_biomarker_correlation(biomarker, value, user_symptoms, biomarker_knowledge)
+            correlation = self._find_symptom_biomarker_correlation(biomarker, value, detected, biomarker_knowledge)
             if correlation:
                 analysis['correlations'].append(correlation)
         
@@ -125,37 +277,22 @@ The insights provided are based on statistical patterns and general medical know
         
         # Assess risks based on biomarker patterns
         risks = []
-        
-        # Diabetes risk
-        if 'glucose' in biomarker_data or 'hba1c' in biomarker_data:
-            diabetes_risk = self._assess_diabetes_risk(biomarker_data, contextual_knowledge)
-            if diabetes_risk:
-                risks.append(diabetes_risk)
-        
-        # Cardiovascular risk
-        if any(bm in biomarker_data for bm in ['total_cholesterol', 'ldl', 'hdl', 'triglycerides']):
-            cv_risk = self._assess_cardiovascular_risk(biomarker_data, contextual_knowledge)
-            if cv_risk:
-                risks.append(cv_risk)
-        
-        # Thyroid risk
-        if 'tsh' in biomarker_data:
-            thyroid_risk = self._assess_thyroid_risk(biomarker_data, contextual_knowledge)
-            if thyroid_risk:
-                risks.append(thyroid_risk)
-        
-        # Inflammation risk
-        if any(bm in biomarker_data for bm in ['crp', 'esr']):
-            inflammation_risk = self._assess_inflammation_risk(biomarker_data, contextual_knowledge)
-            if inflammation_risk:
-                risks.append(inflammation_risk)
+        top_insights = {}
+        for markers, assessor, context_key in self.RISK_ASSESSORS:
+            if not markers.isdisjoint(biomarker_data):
+                # Slice each context once and share the read-only tuple between assessors
+                if context_key not in top_insights:
+                    top_insights[context_key] = tuple(contextual_knowledge.get(context_key, ())[:2])
+                risk = getattr(self, assessor)(biomarker_data, top_insights[context_key])
+                if risk:
+                    risks.append(risk)
         
         analysis['risk_assessments'] = risks
         analysis['overall_risk_level'] = self._calculate_overall_risk_level(risks)
         
         return analysis
     
-    def _generate_recommendations(self, biomarker_data: Dict[str, float], user_symptoms: str, user_lifestyle: str, contextual_knowledge: Dict) -> Dict[str, Any]:
+    def _generate_recommendations(self, biomarker_data: Dict[str, float], critical_findings: List[str], user_lifestyle: str, contextual_knowledge: Dict) -> Dict[str, Any]:
         """Pillar 4: Clear, Actionable Recommendations"""
         analysis = {
             'title': 'Clear, Actionable Recommendations',
@@ -165,8 +302,7 @@ The insights provided are based on statistical patterns and general medical know
             'medical_consultation_required': False
         }
         
-        # Check for critical values requiring immediate medical attention
-        critical_findings = self._identify_critical_findings(biomarker_data)
+        # Critical values requiring immediate medical attention
         if critical_findings:
             analysis['immediate_actions'].extend(critical_findings)
             analysis['medical_consultation_required'] = True
@@ -181,27 +317,18 @@ The insights provided are based on statistical patterns and general medical know
         
         return analysis
     
-    def _classify_biomarker_status(self, biomarker: str, value: float, reference_range: Optional[str]) -> str:
-        """Classify biomarker as Normal, High, Low, or Unknown"""
-        if not reference_range:
-            return "Unknown"
-        
-        # Use the knowledge base classification method
-        return self.kb._classify_value(value, reference_range)
-    
     def _generate_biomarker_interpretation(self, biomarker: str, value: float, status: str, knowledge: List[Dict]) -> str:
         """Generate interpretation for a biomarker based on value and contextual knowledge"""
-        interpretation = f"Your {biomarker} level is {value}, which is classified as {status}."
+        parts = [self.INTERPRETATION_TEMPLATE.format(biomarker=biomarker, value=value, status=status)]
         
-        if knowledge:
-            # Add contextual insights
-            for insight in knowledge[:2]:  # Use top 2 insights
-                if insight['type'] == 'dataset_insight':
-                    interpretation += f" {insight['text']}"
-                elif insight['type'] == 'abnormality_mapping':
-                    interpretation += f" This pattern is associated with {insight['condition']}."
+        # Add contextual insights
+        for insight in knowledge[:2]:  # Use top 2 insights
+            if insight['type'] == 'dataset_insight':
+                parts.append(insight['text'])
+            elif insight['type'] == 'abnormality_mapping':
+                parts.append(self.ASSOCIATION_TEMPLATE.format(condition=insight['condition']))
         
-        return interpretation
+        return " ".join(parts)
     
     def _analyze_symptoms(self, user_symptoms: str) -> Dict[str, Any]:
         """Analyze user-provided symptoms"""
@@ -209,20 +336,8 @@ The insights provided are based on statistical patterns and general medical know
             return {'symptoms_provided': False}
         
         # Simple symptom analysis - in production, you'd use more sophisticated NLP
-        symptoms = user_symptoms.lower().split()
-        common_symptoms = {
-            'fatigue': ['tired', 'fatigue', 'exhausted', 'weak'],
-            'weight_changes': ['weight', 'gain', 'loss', 'obese'],
-            'mood_changes': ['depressed', 'anxious', 'mood', 'irritable'],
-            'digestive_issues': ['nausea', 'vomiting', 'diarrhea', 'constipation'],
-            'cardiovascular': ['chest', 'pain', 'heart', 'palpitations'],
-            'neurological': ['headache', 'dizziness', 'confusion', 'memory']
-        }
-        
-        detected_symptoms = []
-        for category, symptom_list in common_symptoms.items():
-            if any(symptom in user_symptoms.lower() for symptom in symptom_list):
-                detected_symptoms.append(category)
+        found = {match.lastgroup for match in self.SYMPTOM_PATTERN.finditer(user_symptoms)}
+        detected_symptoms = [category for category in self.SYMPTOM_KEYWORDS if category in found]
         
         return {
             'symptoms_provided': True,
@@ -230,7 +345,7 @@ The insights provided are based on statistical patterns and general medical know
             'detected_categories': detected_symptoms
         }
     
-    def _find_symptom_biomarker_correlation(self, biomarker: str, value: float, user_symptoms: str, knowledge: List[Dict]) -> Optional[Dict]:
+    def _find_symptom_biomarker_correlation(self, biomarker: str, value: float, detected: Set[str], knowledge: List[Dict]) -> Optional[Dict]:
         """Find correlations between symptoms and biomarkers"""
         # This is a simplified correlation - in production, you'd use more sophisticated analysis
         correlations = {
@@ -243,8 +358,7 @@ The insights provided are based on statistical patterns and general medical know
         }
         
         if biomarker in correlations:
-            symptom_categories = self._analyze_symptoms(user_symptoms)['detected_categories']
-            matching_symptoms = [cat for cat in symptom_categories if cat in correlations[biomarker]]
+            matching_symptoms = [cat for cat in correlations[biomarker] if cat in detected]
             
             if matching_symptoms:
                 return {
@@ -256,13 +370,13 @@ The insights provided are based on statistical patterns and general medical know
         
         return None
     
-    def _assess_diabetes_risk(self, biomarker_data: Dict[str, float], contextual_knowledge: Dict) -> Optional[Dict]:
+    def _assess_diabetes_risk(self, biomarker_data: Dict[str, float], contextual_insights: Tuple[Dict, ...]) -> Optional[Dict]:
         """Assess diabetes risk based on glucose and HbA1c"""
         risk_factors = []
         risk_level = 'low'
         
-        if 'glucose' in biomarker_data:
-            glucose = biomarker_data['glucose']
+        glucose = biomarker_data.get('glucose')
+        if glucose is not None:
             if glucose >= 126:
                 risk_factors.append(f"Fasting glucose {glucose} mg/dL indicates diabetes")
                 risk_level = 'high'
@@ -270,8 +384,8 @@ The insights provided are based on statistical patterns and general medical know
                 risk_factors.append(f"Fasting glucose {glucose} mg/dL indicates prediabetes")
                 risk_level = 'moderate'
         
-        if 'hba1c' in biomarker_data:
-            hba1c = biomarker_data['hba1c']
+        hba1c = biomarker_data.get('hba1c')
+        if hba1c is not None:
             if hba1c >= 6.5:
                 risk_factors.append(f"HbA1c {hba1c}% indicates diabetes")
                 risk_level = 'high'
@@ -284,30 +398,30 @@ The insights provided are based on statistical patterns and general medical know
                 'condition': 'Diabetes/Pre-diabetes',
                 'risk_level': risk_level,
                 'risk_factors': risk_factors,
-                'contextual_insights': contextual_knowledge.get('general', [])[:2]
+                'contextual_insights': contextual_insights
             }
         
         return None
     
-    def _assess_cardiovascular_risk(self, biomarker_data: Dict[str, float], contextual_knowledge: Dict) -> Optional[Dict]:
+    def _assess_cardiovascular_risk(self, biomarker_data: Dict[str, float], contextual_insights: Tuple[Dict, ...]) -> Optional[Dict]:
         """Assess cardiovascular risk based on lipid profile"""
         risk_factors = []
         risk_level = 'low'
         
-        if 'total_cholesterol' in biomarker_data:
-            tc = biomarker_data['total_cholesterol']
+        tc = biomarker_data.get('total_cholesterol')
+        if tc is not None:
             if tc >= 240:
                 risk_factors.append(f"Total cholesterol {tc} mg/dL is high")
                 risk_level = 'moderate'
         
-        if 'ldl' in biomarker_data:
-            ldl = biomarker_data['ldl']
+        ldl = biomarker_data.get('ldl')
+        if ldl is not None:
             if ldl >= 160:
                 risk_factors.append(f"LDL cholesterol {ldl} mg/dL is high")
                 risk_level = 'moderate'
         
-        if 'hdl' in biomarker_data:
-            hdl = biomarker_data['hdl']
+        hdl = biomarker_data.get('hdl')
+        if hdl is not None:
             if hdl < 40:
                 risk_factors.append(f"HDL cholesterol {hdl} mg/dL is low")
                 risk_level = 'moderate'
@@ -317,15 +431,15 @@ The insights provided are based on statistical patterns and general medical know
                 'condition': 'Cardiovascular Disease',
                 'risk_level': risk_level,
                 'risk_factors': risk_factors,
-                'contextual_insights': contextual_knowledge.get('general', [])[:2]
+                'contextual_insights': contextual_insights
             }
         
         return None
     
-    def _assess_thyroid_risk(self, biomarker_data: Dict[str, float], contextual_knowledge: Dict) -> Optional[Dict]:
+    def _assess_thyroid_risk(self, biomarker_data: Dict[str, float], contextual_insights: Tuple[Dict, ...]) -> Optional[Dict]:
         """Assess thyroid risk based on TSH levels"""
-        if 'tsh' in biomarker_data:
-            tsh = biomarker_data['tsh']
+        tsh = biomarker_data.get('tsh')
+        if tsh is not None:
             risk_factors = []
             risk_level = 'low'
             
@@ -344,24 +458,24 @@ The insights provided are based on statistical patterns and general medical know
                     'condition': 'Thyroid Dysfunction',
                     'risk_level': risk_level,
                     'risk_factors': risk_factors,
-                    'contextual_insights': contextual_knowledge.get('tsh', [])[:2]
+                    'contextual_insights': contextual_insights
                 }
         
         return None
     
-    def _assess_inflammation_risk(self, biomarker_data: Dict[str, float], contextual_knowledge: Dict) -> Optional[Dict]:
+    def _assess_inflammation_risk(self, biomarker_data: Dict[str, float], contextual_insights: Tuple[Dict, ...]) -> Optional[Dict]:
         """Assess inflammation risk based on CRP and ESR"""
         risk_factors = []
         risk_level = 'low'
         
-        if 'crp' in biomarker_data:
-            crp = biomarker_data['crp']
+        crp = biomarker_data.get('crp')
+        if crp is not None:
             if crp > 3.0:
                 risk_factors.append(f"CRP {crp} mg/L indicates elevated inflammation")
                 risk_level = 'moderate'
         
-        if 'esr' in biomarker_data:
-            esr = biomarker_data['esr']
+        esr = biomarker_data.get('esr')
+        if esr is not None:
             if esr > 20:
                 risk_factors.append(f"ESR {esr} mm/hr indicates elevated inflammation")
                 risk_level = 'moderate'
@@ -371,7 +485,7 @@ The insights provided are based on statistical patterns and general medical know
                 'condition': 'Inflammation',
                 'risk_level': risk_level,
                 'risk_factors': risk_factors,
-                'contextual_insights': contextual_knowledge.get('general', [])[:2]
+                'contextual_insights': contextual_insights
             }
         
         return None
@@ -394,69 +508,57 @@ The insights provided are based on statistical patterns and general medical know
         """Identify critical findings requiring immediate medical attention"""
         critical_findings = []
         
-        # Define critical thresholds
-        critical_thresholds = {
-            'glucose': 300,  # Very high glucose
-            'tsh': 20,       # Very high TSH
-            'creatinine': 3.0,  # High creatinine
-            'crp': 10.0      # Very high CRP
-        }
-        
         for biomarker, value in biomarker_data.items():
-            if biomarker in critical_thresholds:
-                if value >= critical_thresholds[biomarker]:
-                    critical_findings.append(f"CRITICAL: {biomarker} level of {value} requires immediate medical attention")
+            if biomarker in self.CRITICAL_THRESHOLDS:
+                if value >= self.CRITICAL_THRESHOLDS[biomarker]:
+                    critical_findings.append(self.CRITICAL_FINDING_TEMPLATE.format(biomarker=biomarker, value=value))
         
         return critical_findings
     
+    def identify_critical_findings_batch(self, biomarker_names: List[str], values: np.ndarray) -> List[List[str]]:
+        """Identify critical findings for many patients at once
+        
+        values is a (patients x biomarkers) array whose columns follow biomarker_names;
+        NaN marks a biomarker that was not measured for that patient.
+        """
+        values = np.asarray(values, dtype=float)
+        
+        # Small batches are cheaper to scan per patient than to hand to the kernel
+        if len(values) <= self.BATCH_KERNEL_MIN_PATIENTS:
+            return [
+                self._identify_critical_findings({name: value for name, value in zip(biomarker_names, row) if not np.isnan(value)})
+                for row in values
+            ]
+        
+        # Imported, and compiled on first call, only when a batch is large enough to need the kernel
+        from health_kernels import critical_mask
+        thresholds = np.array([self.CRITICAL_THRESHOLDS.get(name, np.inf) for name in biomarker_names], dtype=float)
+        mask = critical_mask(values, thresholds)
+        return [
+            [self.CRITICAL_FINDING_TEMPLATE.format(biomarker=biomarker_names[col], value=float(row[col])) for col in np.flatnonzero(row_mask)]
+            for row, row_mask in zip(values, mask)
+        ]
+    
     def _generate_lifestyle_recommendations(self, biomarker_data: Dict[str, float], user_lifestyle: str, contextual_knowledge: Dict) -> List[str]:
         """Generate lifestyle recommendations based on biomarkers"""
-        recommendations = []
-        
         # General recommendations
-        recommendations.append("Maintain a balanced diet rich in fruits, vegetables, and whole grains")
-        recommendations.append("Engage in regular physical activity (at least 150 minutes per week)")
-        recommendations.append("Maintain a healthy weight")
-        recommendations.append("Avoid smoking and limit alcohol consumption")
-        recommendations.append("Get adequate sleep (7-9 hours per night)")
+        recommendations = list(self.GENERAL_LIFESTYLE_RECOMMENDATIONS)
         
         # Specific recommendations based on biomarkers
-        if 'glucose' in biomarker_data or 'hba1c' in biomarker_data:
-            recommendations.append("Limit refined carbohydrates and sugary foods")
-            recommendations.append("Monitor carbohydrate intake and consider portion control")
-        
-        if any(bm in biomarker_data for bm in ['total_cholesterol', 'ldl', 'hdl', 'triglycerides']):
-            recommendations.append("Reduce saturated and trans fats in your diet")
-            recommendations.append("Increase intake of omega-3 fatty acids")
-            recommendations.append("Consider soluble fiber supplements")
-        
-        if 'tsh' in biomarker_data:
-            recommendations.append("Ensure adequate iodine intake through diet")
-            recommendations.append("Consider selenium-rich foods (Brazil nuts, fish)")
-        
-        if 'vitamin_d' in biomarker_data:
-            recommendations.append("Get regular sun exposure (15-30 minutes daily)")
-            recommendations.append("Consider vitamin D supplementation if deficient")
+        for markers, extra in self.LIFESTYLE_RECOMMENDATIONS:
+            if not markers.isdisjoint(biomarker_data):
+                recommendations.extend(extra)
         
         return recommendations
     
     def _generate_monitoring_recommendations(self, biomarker_data: Dict[str, float], contextual_knowledge: Dict) -> List[str]:
         """Generate monitoring recommendations"""
-        recommendations = []
-        
         # General monitoring
-        recommendations.append("Schedule regular follow-up lab tests as recommended by your healthcare provider")
-        recommendations.append("Keep a record of your lab results to track trends over time")
+        recommendations = list(self.GENERAL_MONITORING_RECOMMENDATIONS)
         
         # Specific monitoring based on findings
-        if 'glucose' in biomarker_data or 'hba1c' in biomarker_data:
-            recommendations.append("Monitor blood glucose levels regularly if recommended by your doctor")
-            recommendations.append("Consider HbA1c testing every 3-6 months")
-        
-        if any(bm in biomarker_data for bm in ['total_cholesterol', 'ldl', 'hdl', 'triglycerides']):
-            recommendations.append("Monitor lipid profile every 6-12 months")
-        
-        if 'tsh' in biomarker_data:
-            recommendations.append("Monitor thyroid function tests every 6-12 months")
+        for markers, extra in self.MONITORING_RECOMMENDATIONS:
+            if not markers.isdisjoint(biomarker_data):
+                recommendations.extend(extra)
         
         return recommendations
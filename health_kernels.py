@@ -0,0 +1,24 @@
+"""
+Numeric kernels for batch health analysis, JIT-compiled with Numba when it is installed
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    
+    def njit(*args, **kwargs):
+        """Fallback that leaves the kernel as plain NumPy when Numba is not installed"""
+        return lambda func: func
+
+@njit(cache=True, parallel=True)
+def critical_mask(values: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """Flag values at or above their column's critical threshold
+    
+    values is a (patients x biomarkers) float array with NaN for missing values;
+    thresholds holds one entry per biomarker column, inf where none applies.
+    """
+    return values >= thresholds
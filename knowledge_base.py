@@ -8,40 +8,114 @@ import numpy as np
 from typing import Dict, List, Tuple, Any, Optional
 import json
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-import faiss
-import pickle
-import os
+import ast
+import functools
+import hashlib
+import re
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Below IVF_MIN_VECTORS an HNSW graph beats inverted lists on both recall and latency;
+# int8 scalar-quantized lists hold up to IVFPQ_MIN_VECTORS, product-quantized ones beyond
+IVF_MIN_VECTORS = 10000
+IVFPQ_MIN_VECTORS = 1000000
+
+# HNSW graph degree and build/search beam widths for the small-corpus tier
+HNSW_NEIGHBORS = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 32
+
+# Quantizer training sample size and the candidate multiplier re-ranked against float16 vectors;
+# k-means wants at least 39 points per coarse centroid, so large nlist values raise the sample
+QUANTIZER_TRAINING_SAMPLE = 50000
+TRAINING_POINTS_PER_CENTROID = 40
+RERANK_K_FACTOR = 4
+
+# Upper bound on PQ sub-quantizers; 384-dim MiniLM vectors split into 48 codes of 8 dims
+PQ_MAX_SUBQUANTIZERS = 48
+
+# Okapi BM25 term-frequency saturation and length normalization for keyword search,
+# and the rank offset used when fusing keyword and vector rankings
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60
+
+# Dataset CSVs read by load_datasets
+DATASET_FILES = {
+    'comprehensive': 'comprehensive_biomarkers_dataset.csv',
+    'diabetes': 'diabetes_prediabetes_dataset.csv',
+    'thyroid': 'thyroid_hypothyroid_dataset.csv',
+    'dyslipidemia': 'dyslipidemia_cvd_dataset.csv',
+    'inflammation': 'inflammation_dataset.csv',
+    'medical_labs': 'medical_labs_training_weaklabels.csv'
+}
+
+# Sentence encoder; its name is part of the persisted index key
+EMBEDDING_MODEL = 'all-MiniLM-L6-v2'
+
+# Persisted index, named by a hash of the encoder backend and knowledge texts, written next to the data files
+INDEX_FILE_PATTERN = 'kb_{}.faiss'
+# Only files of exactly this shape, or their interrupted writes, are swept as stale,
+# so user files such as kb_backup.faiss survive
+HASHED_INDEX_FILE = re.compile(r'kb_[0-9a-f]{16}\.faiss(\.partial)?')
+ONNX_MODEL_DIR = 'kb_onnx'
+
+# One ("abnormality", "condition", "prevalence") tuple per line in data (1).txt
+ABNORMALITY_TUPLE_LINE = re.compile(r'^[ \t]*(\(.*\))[ \t]*,?[ \t]*$', re.MULTILINE)
 
 class MedicalKnowledgeBase:
     def __init__(self, data_dir: str = "."):
         self.data_dir = Path(data_dir)
         self.datasets = {}
         self.reference_ranges = {}
+        self._ref_index = {}
+        self._ref_lo = np.array([np.nan])
+        self._ref_hi = np.array([np.nan])
+        self._ref_text_by_name = {}
+        self._ref_name_words = 0
         self.abnormalities_mapping = {}
-        self.embedding_model = None
         self.vector_index = None
+        self._corpus_indexed = False
+        self._keyword_postings = {}
+        self._index_lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._query_embedding_cache = LRUCache(1024)
+        self._gpu_resources = None
         self.knowledge_embeddings = None
         self.knowledge_texts = []
         
     def load_datasets(self):
         """Load all medical datasets from CSV files"""
-        dataset_files = {
-            'comprehensive': 'comprehensive_biomarkers_dataset.csv',
-            'diabetes': 'diabetes_prediabetes_dataset.csv',
-            'thyroid': 'thyroid_hypothyroid_dataset.csv',
-            'dyslipidemia': 'dyslipidemia_cvd_dataset.csv',
-            'inflammation': 'inflammation_dataset.csv',
-            'medical_labs': 'medical_labs_training_weaklabels.csv'
-        }
-        
-        for name, filename in dataset_files.items():
-            filepath = self.data_dir / filename
-            if filepath.exists():
-                self.datasets[name] = pd.read_csv(filepath)
-                print(f"Loaded {name} dataset: {len(self.datasets[name])} records")
-            else:
-                print(f"Warning: {filename} not found")
+        # The CSV parsers release the GIL, so all files are read in parallel
+        with ThreadPoolExecutor(max_workers=len(DATASET_FILES)) as executor:
+            futures = {
+                name: executor.submit(self._read_csv, self.data_dir / filename)
+                for name, filename in DATASET_FILES.items()
+                if (self.data_dir / filename).exists()
+            }
+            
+            for name, filename in DATASET_FILES.items():
+                if name in futures:
+                    self.datasets[name] = futures[name].result()
+                    print(f"Loaded {name} dataset: {len(self.datasets[name])} records")
+                else:
+                    print(f"Warning: {filename} not found")
+    
+    @staticmethod
+    def _read_csv(filepath: Path) -> pd.DataFrame:
+        """Read a CSV with the multithreaded PyArrow parser, falling back to pandas' C parser"""
+        try:
+            return pd.read_csv(filepath, engine='pyarrow')
+        except (ImportError, ValueError):
+            # pyarrow is not installed or cannot handle this file
+            return pd.read_csv(filepath)
     
     def load_reference_data(self):
         """Load reference ranges and abnormality mappings from text files"""
@@ -58,9 +132,90 @@ class MedicalKnowledgeBase:
             with open(data1_file, 'r', encoding='utf-8') as f:
                 content = f.read()
                 self._parse_abnormalities_mapping(content)
+        
+        self._index_reference_ranges()
+    
+    def _index_reference_ranges(self):
+        """Parse every reference range once into numeric bounds and an exact-name lookup"""
+        # Bounds are arrays aligned with _ref_index; the trailing NaN slot stands in for unknown biomarkers
+        self._ref_index = {biomarker: i for i, biomarker in enumerate(self.reference_ranges)}
+        bounds = [self._parse_range(range_info) for range_info in self.reference_ranges.values()]
+        self._ref_lo = np.array([low for low, _ in bounds] + [np.nan])
+        self._ref_hi = np.array([high for _, high in bounds] + [np.nan])
+        
+        self._ref_text_by_name = {}
+        for biomarker, range_info in self.reference_ranges.items():
+            # Reference range texts are found by biomarker name, not by embedding similarity
+            self._ref_text_by_name[' '.join(self._name_tokens(biomarker))] = {
+                'text': f"Reference range for {biomarker}: {range_info}",
+                'type': 'reference_range',
+                'biomarker': biomarker,
+                'source': 'reference_ranges'
+            }
+        self._ref_name_words = max((len(name.split()) for name in self._ref_text_by_name), default=0)
+    
+    @staticmethod
+    def _name_tokens(text: str) -> List[str]:
+        """Lowercase word tokens, so 'vitamin_d' and 'Vitamin D' compare equal"""
+        return re.findall(r'[a-z0-9]+', text.lower())
+    
+    def _match_reference_ranges(self, query: str) -> List[Dict]:
+        """Reference range entries for every biomarker named in the query, in order of mention"""
+        tokens = self._name_tokens(query)
+        matches = []
+        seen = set()
+        for start in range(len(tokens)):
+            # Prefer the longest name starting at each word, e.g. 'ldl cholesterol' over 'ldl'
+            for length in range(min(self._ref_name_words, len(tokens) - start), 0, -1):
+                entry = self._ref_text_by_name.get(' '.join(tokens[start:start + length]))
+                if entry is not None:
+                    if entry['biomarker'] not in seen:
+                        seen.add(entry['biomarker'])
+                        result = entry.copy()
+                        result['relevance_score'] = 1.0
+                        matches.append(result)
+                    break
+        return matches
+    
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def _parse_range(range_info: str) -> Tuple[float, float]:
+        """Parse a reference range into (low, high) bounds, NaN when it cannot be parsed
+        
+        Values below low are Low and values above high are High. One-sided ranges are
+        nudged by one ulp so '< x' flags x itself as High and '> x' flags x as Low.
+        """
+        try:
+            if '<' in range_info:
+                threshold = float(range_info.split('<')[1].split()[0])
+                return -np.inf, np.nextafter(threshold, -np.inf)
+            elif '>' in range_info:
+                threshold = float(range_info.split('>')[1].split()[0])
+                return np.nextafter(threshold, np.inf), np.inf
+            elif '-' in range_info:
+                parts = range_info.split('-')
+                if len(parts) == 2:
+                    return float(parts[0].split()[-1]), float(parts[1].split()[0])
+        except (ValueError, IndexError):
+            pass
+        
+        return np.nan, np.nan
     
     def _parse_reference_ranges(self, content: str):
         """Parse reference ranges from data.txt content"""
+        # data.txt is normally a flat JSON object, which the C parser handles in one pass
+        try:
+            ranges = orjson.loads(content) if orjson is not None else json.loads(content)
+        except ValueError:
+            ranges = None
+        
+        if isinstance(ranges, dict) and all(isinstance(value, str) for value in ranges.values()):
+            self.reference_ranges.update(ranges)
+        else:
+            self._parse_reference_range_lines(content)
+    
+    def _parse_reference_range_lines(self, content: str):
+        """Line-by-line fallback for reference range files that are not valid JSON"""
         lines = content.split('\n')
         for line in lines:
             if ':' in line and '"' in line:
@@ -73,6 +228,22 @@ class MedicalKnowledgeBase:
     
     def _parse_abnormalities_mapping(self, content: str):
         """Parse abnormalities mapping from data (1).txt content"""
+        # Evaluate every tuple line as one Python literal list instead of splitting strings
+        try:
+            rows = ast.literal_eval('[' + ','.join(ABNORMALITY_TUPLE_LINE.findall(content)) + ']')
+        except (ValueError, SyntaxError):
+            self._parse_abnormality_lines(content)
+            return
+        
+        for row in rows:
+            if isinstance(row, tuple) and len(row) >= 2 and all(isinstance(item, str) for item in row):
+                self.abnormalities_mapping.setdefault(row[0], []).append({
+                    'condition': row[1],
+                    'prevalence': row[2] if len(row) > 2 else ""
+                })
+    
+    def _parse_abnormality_lines(self, content: str):
+        """Line-by-line fallback for abnormality files that are not valid tuple literals"""
         lines = content.split('\n')
         current_abnormality = None
         
@@ -101,22 +272,122 @@ class MedicalKnowledgeBase:
     
     def initialize_embeddings(self):
         """Initialize sentence transformer model and create embeddings for knowledge base"""
-        self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
-        self._create_knowledge_embeddings()
+        self._ensure_index()
     
-    def _create_knowledge_embeddings(self):
-        """Create embeddings for all knowledge base content"""
+    def _ensure_index(self):
+        """Load the persisted index, or build it, the first time retrieval needs it"""
+        if self.vector_index is not None or self._corpus_indexed:
+            return
+        
+        with self._index_lock:
+            if self.vector_index is not None or self._corpus_indexed:
+                return
+            
+            # Building the texts is cheap next to encoding them, and their hash names the index
+            self._create_knowledge_texts()
+            self._build_keyword_index()
+            if self.knowledge_texts:
+                index_path = self.data_dir / INDEX_FILE_PATTERN.format(self._corpus_key())
+                if not self._load_persisted_index(index_path):
+                    self._create_knowledge_embeddings()
+                    self._persist_index(index_path)
+            
+            # An empty corpus stays without a vector index; don't rescan the datasets on every query
+            self._corpus_indexed = True
+    
+    @functools.cached_property
+    def embedding_model(self):
+        """Sentence encoder, loaded on first use so startup skips torch and the model weights"""
+        with self._model_lock:
+            if 'embedding_model' in self.__dict__:
+                return self.__dict__['embedding_model']
+            
+            import torch
+            if torch.cuda.is_available():
+                from sentence_transformers import SentenceTransformer
+                return SentenceTransformer(EMBEDDING_MODEL, device='cuda')
+            
+            from onnx_encoder import QuantizedSentenceEncoder, ONNX_AVAILABLE
+            if ONNX_AVAILABLE:
+                # int8 ONNX graph is several times faster than FP32 PyTorch on CPU
+                return QuantizedSentenceEncoder(f'sentence-transformers/{EMBEDDING_MODEL}', self.data_dir / ONNX_MODEL_DIR)
+            
+            from sentence_transformers import SentenceTransformer
+            return SentenceTransformer(EMBEDDING_MODEL, device='cpu')
+    
+    def _encoder_backend(self) -> str:
+        """Name the loaded encoder's backend, e.g. fp32 SentenceTransformer on CUDA or int8 ONNX on CPU"""
+        # Each backend embeds the same text slightly differently, so their vectors must not be mixed
+        model = self.embedding_model
+        return f"{EMBEDDING_MODEL}:{type(model).__name__}:{getattr(model, 'device', 'cpu')}"
+    
+    def _corpus_key(self) -> str:
+        """Hash the encoder backend and knowledge texts; any change to either needs a new index"""
+        digest = hashlib.sha256(self._encoder_backend().encode('utf-8'))
+        for item in self.knowledge_texts:
+            digest.update(b'\0' + item['text'].encode('utf-8'))
+        return digest.hexdigest()[:16]
+    
+    def _load_persisted_index(self, index_path: Path) -> bool:
+        """Memory-map the persisted index instead of re-encoding the corpus"""
+        if not index_path.exists():
+            return False
+        
+        try:
+            index = self._read_index(str(index_path))
+        except RuntimeError as e:
+            print(f"Error loading persisted index, rebuilding: {e}")
+            return False
+        
+        if index.ntotal != len(self.knowledge_texts):
+            return False
+        
+        self.vector_index = self._place_index(index)
+        return True
+    
+    def _persist_index(self, index_path: Path):
+        """Write the index so later runs over the same corpus can skip encoding"""
+        import faiss
+        partial_path = index_path.with_name(index_path.name + '.partial')
+        try:
+            # Renamed into place so a partial write is never picked up
+            faiss.write_index(self._cpu_index(), str(partial_path))
+            partial_path.replace(index_path)
+            
+            # Indexes for earlier versions of the corpus can never be loaded again
+            for stale_path in self.data_dir.glob(INDEX_FILE_PATTERN.format('*') + '*'):
+                if stale_path != index_path and HASHED_INDEX_FILE.fullmatch(stale_path.name):
+                    stale_path.unlink()
+        except (OSError, RuntimeError) as e:
+            print(f"Error persisting index: {e}")
+    
+    @staticmethod
+    def _read_index(path: str):
+        """Read a FAISS index memory-mapped so the OS page cache serves its vectors"""
+        import faiss
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Not every index type supports mmap; read it into memory instead
+            return faiss.read_index(path)
+    
+    @staticmethod
+    def _read_json(path) -> Any:
+        """Read a JSON file, using orjson when it is installed"""
+        data = Path(path).read_bytes()
+        return orjson.loads(data) if orjson is not None else json.loads(data)
+    
+    @staticmethod
+    def _write_json(path, obj: Any):
+        """Write a JSON file, using orjson when it is installed"""
+        data = orjson.dumps(obj) if orjson is not None else json.dumps(obj).encode('utf-8')
+        Path(path).write_bytes(data)
+    
+    def _create_knowledge_texts(self):
+        """Collect the texts that make up the searchable knowledge base"""
         self.knowledge_texts = []
         
-        # Add reference ranges
-        for biomarker, range_info in self.reference_ranges.items():
-            text = f"Reference range for {biomarker}: {range_info}"
-            self.knowledge_texts.append({
-                'text': text,
-                'type': 'reference_range',
-                'biomarker': biomarker,
-                'source': 'reference_ranges'
-            })
+        # Reference ranges are served from the exact-name lookup built in _index_reference_ranges
         
         # Add abnormalities mapping
         for abnormality, conditions in self.abnormalities_mapping.items():
@@ -132,18 +403,83 @@ class MedicalKnowledgeBase:
         
         # Add dataset insights
         self._add_dataset_insights()
-        
-        # Create embeddings
+    
+    def _create_knowledge_embeddings(self):
+        """Create embeddings for all knowledge base content"""
         texts_only = [item['text'] for item in self.knowledge_texts]
-        self.knowledge_embeddings = self.embedding_model.encode(texts_only)
+        self.knowledge_embeddings = self._encode(texts_only, batch_size=1024)
         
         # Create FAISS index
-        dimension = self.knowledge_embeddings.shape[1]
-        self.vector_index = faiss.IndexFlatIP(dimension)
+        self.vector_index = self._place_index(self._build_vector_index(self.knowledge_embeddings))
+    
+    def _place_index(self, index):
+        """Move the index onto the GPU when faiss has GPU support and a device is present"""
+        import faiss
+        if not hasattr(faiss, 'StandardGpuResources') or faiss.get_num_gpus() == 0:
+            return index
+        
+        if self._gpu_resources is None:
+            self._gpu_resources = faiss.StandardGpuResources()
+        try:
+            return faiss.index_cpu_to_gpu(self._gpu_resources, 0, index)
+        except RuntimeError:
+            # HNSW graphs have no GPU implementation, so keep searching on the CPU
+            return index
+    
+    def _cpu_index(self):
+        """Return a CPU copy of the index for serialization"""
+        if self._gpu_resources is None:
+            return self.vector_index
         
-        # Normalize embeddings for cosine similarity
-        faiss.normalize_L2(self.knowledge_embeddings)
-        self.vector_index.add(self.knowledge_embeddings)
+        import faiss
+        return faiss.index_gpu_to_cpu(self.vector_index)
+    
+    def _build_vector_index(self, embeddings: np.ndarray):
+        """Build an approximate inner-product index sized to the number of vectors
+        
+        Small corpora get an HNSW graph over int8 scalar-quantized vectors. Medium corpora use
+        IVF lists of the same int8 codes. Large corpora use IVF+PQ codes whose candidates
+        are re-ranked against a float16 copy, so scores stay close to exact cosine similarity.
+        """
+        import faiss
+        count, dimension = embeddings.shape
+        
+        if count < IVF_MIN_VECTORS:
+            # HNSW graph over int8 codes: a quarter of the bytes per distance for ~1% recall@5
+            index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_8bit, HNSW_NEIGHBORS,
+                                      faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+            index.train(embeddings)
+            index.add(embeddings)
+            return index
+        
+        # Inverted lists: probe a few coarse cells instead of scanning every vector
+        nlist = max(8, int(4 * np.sqrt(count)))
+        training_size = max(QUANTIZER_TRAINING_SAMPLE, TRAINING_POINTS_PER_CENTROID * nlist)
+        training_set = embeddings
+        if count > training_size:
+            sample = np.random.default_rng(0).choice(count, training_size, replace=False)
+            training_set = embeddings[sample]
+        
+        if count < IVFPQ_MIN_VECTORS:
+            # SQ8 codes are a quarter of float32 and score almost exactly, so no re-rank is needed
+            index = faiss.index_factory(dimension, f"IVF{nlist},SQ8", faiss.METRIC_INNER_PRODUCT)
+            faiss.extract_index_ivf(index).nprobe = 8
+            index.train(training_set)
+            index.add(embeddings)
+            return index
+        
+        sub_quantizers = max(m for m in range(1, PQ_MAX_SUBQUANTIZERS + 1) if dimension % m == 0)
+        base_index = faiss.index_factory(dimension, f"IVF{nlist},PQ{sub_quantizers}x8", faiss.METRIC_INNER_PRODUCT)
+        faiss.extract_index_ivf(base_index).nprobe = 8
+        
+        refine_index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+        index = faiss.IndexRefine(base_index, refine_index)
+        index.k_factor = RERANK_K_FACTOR
+        index.train(training_set)
+        index.add(embeddings)
+        return index
     
     def _add_dataset_insights(self):
         """Add statistical insights from datasets"""
@@ -163,11 +499,12 @@ class MedicalKnowledgeBase:
         """Add insights from comprehensive biomarkers dataset"""
         # TSH insights
         if 'tsh_uIU_mL' in df.columns:
-            tsh_data = df['tsh_uIU_mL'].dropna()
-            if len(tsh_data) > 0:
-                tsh_high = tsh_data[tsh_data > 4.5]
-                if len(tsh_high) > 0:
-                    text = f"From comprehensive dataset: {len(tsh_high)}/{len(tsh_data)} patients have TSH > 4.5 mIU/L, indicating potential hypothyroidism"
+            # Count straight off the column arrays; NaN compares False so no dropna copy is needed
+            tsh_total = int(df['tsh_uIU_mL'].count())
+            if tsh_total > 0:
+                tsh_high = np.count_nonzero(df['tsh_uIU_mL'].to_numpy() > 4.5)
+                if tsh_high > 0:
+                    text = f"From comprehensive dataset: {tsh_high}/{tsh_total} patients have TSH > 4.5 mIU/L, indicating potential hypothyroidism"
                     self.knowledge_texts.append({
                         'text': text,
                         'type': 'dataset_insight',
@@ -178,12 +515,12 @@ class MedicalKnowledgeBase:
         
         # HbA1c insights
         if 'hba1c_percent' in df.columns:
-            hba1c_data = df['hba1c_percent'].dropna()
-            if len(hba1c_data) > 0:
-                prediabetes = hba1c_data[(hba1c_data >= 5.7) & (hba1c_data < 6.5)]
-                diabetes = hba1c_data[hba1c_data >= 6.5]
-                if len(prediabetes) > 0:
-                    text = f"From comprehensive dataset: {len(prediabetes)}/{len(hba1c_data)} patients have HbA1c 5.7-6.4%, indicating prediabetes"
+            hba1c_total = int(df['hba1c_percent'].count())
+            if hba1c_total > 0:
+                hba1c = df['hba1c_percent'].to_numpy()
+                prediabetes = np.count_nonzero((hba1c >= 5.7) & (hba1c < 6.5))
+                if prediabetes > 0:
+                    text = f"From comprehensive dataset: {prediabetes}/{hba1c_total} patients have HbA1c 5.7-6.4%, indicating prediabetes"
                     self.knowledge_texts.append({
                         'text': text,
                         'type': 'dataset_insight',
@@ -195,10 +532,9 @@ class MedicalKnowledgeBase:
     def _add_diabetes_insights(self, df: pd.DataFrame):
         """Add insights from diabetes dataset"""
         if 'hba1c_percent' in df.columns:
-            hba1c_data = df['hba1c_percent'].dropna()
-            if len(hba1c_data) > 0:
-                prediabetes_count = len(df[df['label_prediabetes'] == 1])
-                diabetes_count = len(df[df['label_diabetes'] == 1])
+            if df['hba1c_percent'].count() > 0:
+                prediabetes_count = int((df['label_prediabetes'].to_numpy() == 1).sum())
+                diabetes_count = int((df['label_diabetes'].to_numpy() == 1).sum())
                 text = f"From diabetes dataset: {prediabetes_count} patients with prediabetes, {diabetes_count} with diabetes out of {len(df)} total"
                 self.knowledge_texts.append({
                     'text': text,
@@ -210,7 +546,7 @@ class MedicalKnowledgeBase:
     def _add_thyroid_insights(self, df: pd.DataFrame):
         """Add insights from thyroid dataset"""
         if 'tsh_uIU_mL' in df.columns:
-            hypothyroid_count = len(df[df['label_hypothyroid'] == 1])
+            hypothyroid_count = int((df['label_hypothyroid'].to_numpy() == 1).sum())
             text = f"From thyroid dataset: {hypothyroid_count}/{len(df)} patients diagnosed with hypothyroidism"
             self.knowledge_texts.append({
                 'text': text,
@@ -222,7 +558,7 @@ class MedicalKnowledgeBase:
     def _add_dyslipidemia_insights(self, df: pd.DataFrame):
         """Add insights from dyslipidemia dataset"""
         if 'label_dyslipidemia' in df.columns:
-            dyslipidemia_count = len(df[df['label_dyslipidemia'] == 1])
+            dyslipidemia_count = int((df['label_dyslipidemia'].to_numpy() == 1).sum())
             text = f"From dyslipidemia dataset: {dyslipidemia_count}/{len(df)} patients diagnosed with dyslipidemia"
             self.knowledge_texts.append({
                 'text': text,
@@ -234,7 +570,7 @@ class MedicalKnowledgeBase:
     def _add_inflammation_insights(self, df: pd.DataFrame):
         """Add insights from inflammation dataset"""
         if 'label_inflammation' in df.columns:
-            inflammation_count = len(df[df['label_inflammation'] == 1])
+            inflammation_count = int((df['label_inflammation'].to_numpy() == 1).sum())
             text = f"From inflammation dataset: {inflammation_count}/{len(df)} patients show signs of inflammation"
             self.knowledge_texts.append({
                 'text': text,
@@ -245,19 +581,120 @@ class MedicalKnowledgeBase:
     
     def retrieve_contextual_knowledge(self, query: str, top_k: int = 5) -> List[Dict]:
         """Retrieve relevant contextual knowledge based on query"""
-        if self.vector_index is None or self.embedding_model is None:
+        return self.retrieve_contextual_knowledge_batch([query], top_k)[0]
+    
+    def retrieve_contextual_knowledge_batch(self, queries: List[str], top_k: int = 5) -> List[List[Dict]]:
+        """Retrieve contextual knowledge for several queries with a single encode and index search"""
+        if not queries:
             return []
         
-        # Encode query
-        query_embedding = self.embedding_model.encode([query])
-        faiss.normalize_L2(query_embedding)
+        # Biomarkers named in a query get their reference range first, without a model call
+        results = [self._match_reference_ranges(query)[:top_k] for query in queries]
+        pending = [i for i, matches in enumerate(results) if len(matches) < top_k]
+        if not pending:
+            return results
         
-        # Search
-        scores, indices = self.vector_index.search(query_embedding, top_k)
+        self._ensure_index()
+        if self.vector_index is None:
+            return results
         
+        # Encode the remaining queries as one matrix and search them in one pass
+        query_embeddings = self._encode_queries([queries[i] for i in pending])
+        scores, indices = self.vector_index.search(query_embeddings, top_k)
+        
+        for i, row_scores, row_indices in zip(pending, scores, indices):
+            results[i].extend(self._collect_results(row_scores, row_indices)[:top_k - len(results[i])])
+        return results
+    
+    def hybrid_search(self, query: str, top_k: int = 5) -> List[Dict]:
+        """Retrieve knowledge by fusing BM25 keyword and vector rankings with reciprocal rank fusion"""
+        results = self._match_reference_ranges(query)[:top_k]
+        remaining = top_k - len(results)
+        if remaining <= 0:
+            return results
+        
+        self._ensure_index()
+        if self.vector_index is None:
+            return results
+        
+        # Both rankings go twice as deep as needed, so entries only one of them ranks highly can still surface
+        candidates = 2 * remaining
+        _, vector_ranking = self.vector_index.search(self._encode_queries([query]), candidates)
+        fused = {}
+        for ranking in (vector_ranking[0], self._keyword_search(query, candidates)):
+            for rank, idx in enumerate(int(i) for i in ranking if i >= 0):
+                fused[idx] = fused.get(idx, 0.0) + 1.0 / (RRF_K + rank + 1)
+        
+        order = sorted(fused, key=fused.get, reverse=True)[:remaining]
+        results.extend(self._collect_results([fused[idx] for idx in order], order))
+        return results
+    
+    def _build_keyword_index(self):
+        """Build a BM25 inverted index over the knowledge texts"""
+        documents = [Counter(self._name_tokens(item['text'])) for item in self.knowledge_texts]
+        lengths = np.array([sum(document.values()) for document in documents], dtype=float)
+        
+        postings = {}
+        for doc_id, document in enumerate(documents):
+            for term, frequency in document.items():
+                postings.setdefault(term, []).append((doc_id, frequency))
+        
+        # A term's BM25 weight in a document does not depend on the query, so searches only sum them
+        self._keyword_postings = {}
+        for term, entries in postings.items():
+            ids = np.array([doc_id for doc_id, _ in entries], dtype=np.intp)
+            frequencies = np.array([frequency for _, frequency in entries], dtype=float)
+            idf = np.log(1 + (len(documents) - len(ids) + 0.5) / (len(ids) + 0.5))
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / lengths.mean())
+            self._keyword_postings[term] = (ids, idf * frequencies * (BM25_K1 + 1) / (frequencies + norm))
+    
+    def _keyword_search(self, query: str, k: int) -> np.ndarray:
+        """Indices of the k knowledge texts with the highest BM25 score for the query"""
+        scores = np.zeros(len(self.knowledge_texts))
+        for term in self._name_tokens(query):
+            if term in self._keyword_postings:
+                ids, weights = self._keyword_postings[term]
+                scores[ids] += weights
+        
+        matched = np.flatnonzero(scores)
+        return matched[np.argsort(-scores[matched], kind='stable')[:k]]
+    
+    def warm_up(self, queries: Tuple[str, ...] = ('glucose', 'cholesterol', 'tsh')):
+        """Load the encoder and run a search so the first real query starts warm"""
+        self._ensure_index()
+        if self.vector_index is None:
+            return
+        
+        # Bypasses the query cache, which should only hold real queries
+        self.vector_index.search(self._encode(list(queries)), 5)
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode queries, reusing cached embeddings for text seen before"""
+        # MiniLM's tokenizer is uncased and splits on whitespace, so this keeps the embedding
+        keys = [' '.join(query.lower().split()) for query in queries]
+        embeddings = [self._query_embedding_cache.get(key) for key in keys]
+        
+        missing = list({key: None for key, embedding in zip(keys, embeddings) if embedding is None})
+        if missing:
+            encoded = dict(zip(missing, self._encode(missing)))
+            for key, embedding in encoded.items():
+                self._query_embedding_cache.put(key, embedding)
+            embeddings = [encoded[key] if embedding is None else embedding for key, embedding in zip(keys, embeddings)]
+        
+        return np.vstack(embeddings)
+    
+    def _encode(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Encode texts into L2-normalized float32 vectors for the FAISS index"""
+        # Stay in torch tensors on the encoding device and copy to host only at the FAISS boundary
+        embeddings = self.embedding_model.encode(texts, batch_size=batch_size, show_progress_bar=False,
+                                                 convert_to_tensor=True, normalize_embeddings=True)
+        return embeddings.cpu().numpy().astype('float32')
+    
+    def _collect_results(self, scores: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        """Map one row of FAISS search output back to knowledge entries"""
         results = []
-        for score, idx in zip(scores[0], indices[0]):
-            if idx < len(self.knowledge_texts):
+        for score, idx in zip(scores, indices):
+            if 0 <= idx < len(self.knowledge_texts):
                 result = self.knowledge_texts[idx].copy()
                 result['relevance_score'] = float(score)
                 results.append(result)
@@ -278,78 +715,79 @@ class MedicalKnowledgeBase:
     
     def analyze_biomarker_values(self, biomarker_values: Dict[str, float]) -> Dict[str, Any]:
         """Analyze biomarker values against reference ranges and datasets"""
-        analysis = {}
+        biomarkers = [biomarker for biomarker in biomarker_values if biomarker in self.reference_ranges]
+        values = [biomarker_values[biomarker] for biomarker in biomarkers]
         
-        for biomarker, value in biomarker_values.items():
-            if biomarker in self.reference_ranges:
-                range_info = self.reference_ranges[biomarker]
-                analysis[biomarker] = {
-                    'value': value,
-                    'reference_range': range_info,
-                    'status': self._classify_value(value, range_info),
-                    'contextual_knowledge': self.retrieve_contextual_knowledge(f"{biomarker} {value}", top_k=3)
-                }
+        # One vectorized classification and one batched retrieval for all biomarkers
+        statuses = self.classify_values(biomarkers, values).tolist()
+        knowledge = self.retrieve_contextual_knowledge_batch(
+            [f"{biomarker} {value}" for biomarker, value in zip(biomarkers, values)], top_k=3
+        )
+        
+        analysis = {}
+        for biomarker, value, status, contextual_knowledge in zip(biomarkers, values, statuses, knowledge):
+            analysis[biomarker] = {
+                'value': value,
+                'reference_range': self.reference_ranges[biomarker],
+                'status': status,
+                'contextual_knowledge': contextual_knowledge
+            }
         
         return analysis
     
+    def is_within_range(self, biomarker: str, value: float) -> bool:
+        """Check whether a value lies inside its biomarker's known reference range"""
+        i = self._ref_index.get(biomarker)
+        # Unparseable ranges have NaN bounds, which fail both comparisons
+        return i is not None and bool(self._ref_lo[i] <= value <= self._ref_hi[i])
+    
+    def classify_values(self, biomarkers: List[str], values: np.ndarray) -> np.ndarray:
+        """Classify many biomarker values at once as Normal, High, Low, or Unknown"""
+        unknown = len(self._ref_index)
+        idx = np.fromiter((self._ref_index.get(b, unknown) for b in biomarkers), dtype=np.intp, count=len(biomarkers))
+        lo = self._ref_lo[idx]
+        hi = self._ref_hi[idx]
+        values = np.asarray(values, dtype=float)
+        
+        status = np.where(values < lo, 'Low', np.where(values > hi, 'High', 'Normal'))
+        return np.where(np.isnan(lo), 'Unknown', status)
+    
     def _classify_value(self, value: float, range_info: str) -> str:
         """Classify biomarker value as Normal, High, or Low based on reference range"""
-        # Simple parsing of reference ranges
-        # This is a basic implementation - in production, you'd want more sophisticated parsing
-        try:
-            if '<' in range_info:
-                threshold = float(range_info.split('<')[1].split()[0])
-                return "High" if value >= threshold else "Normal"
-            elif '>' in range_info:
-                threshold = float(range_info.split('>')[1].split()[0])
-                return "Low" if value <= threshold else "Normal"
-            elif '-' in range_info:
-                parts = range_info.split('-')
-                if len(parts) == 2:
-                    low = float(parts[0].split()[-1])
-                    high = float(parts[1].split()[0])
-                    if value < low:
-                        return "Low"
-                    elif value > high:
-                        return "High"
-                    else:
-                        return "Normal"
-        except:
-            pass
-        
-        return "Unknown"
+        # Distinct range strings are few, so the parse is cached and this is two comparisons
+        low, high = self._parse_range(range_info)
+        if np.isnan(low):
+            return "Unknown"
+        elif value < low:
+            return "Low"
+        elif value > high:
+            return "High"
+        return "Normal"
     
     def save_knowledge_base(self, filepath: str):
-        """Save the knowledge base to disk"""
-        kb_data = {
+        """Save the knowledge base to disk as a FAISS index plus a JSON metadata file"""
+        import faiss
+        # Check before writing anything, so a failed save never leaves a JSON file without its index
+        self._ensure_index()
+        if self.vector_index is None:
+            raise ValueError("Cannot save the knowledge base: there are no knowledge texts to index")
+        
+        self._write_json(filepath + '.json', {
             'reference_ranges': self.reference_ranges,
             'abnormalities_mapping': self.abnormalities_mapping,
             'knowledge_texts': self.knowledge_texts
-        }
-        
-        with open(filepath, 'wb') as f:
-            pickle.dump(kb_data, f)
-        
-        # Save embeddings separately
-        embeddings_file = filepath.replace('.pkl', '_embeddings.npy')
-        np.save(embeddings_file, self.knowledge_embeddings)
+        })
+        faiss.write_index(self._cpu_index(), filepath + '.faiss')
     
     def load_knowledge_base(self, filepath: str):
         """Load the knowledge base from disk"""
-        with open(filepath, 'rb') as f:
-            kb_data = pickle.load(f)
+        kb_data = self._read_json(filepath + '.json')
         
         self.reference_ranges = kb_data['reference_ranges']
         self.abnormalities_mapping = kb_data['abnormalities_mapping']
         self.knowledge_texts = kb_data['knowledge_texts']
+        self._index_reference_ranges()
+        self._build_keyword_index()
         
-        # Load embeddings
-        embeddings_file = filepath.replace('.pkl', '_embeddings.npy')
-        if os.path.exists(embeddings_file):
-            self.knowledge_embeddings = np.load(embeddings_file)
-            
-            # Recreate FAISS index
-            dimension = self.knowledge_embeddings.shape[1]
-            self.vector_index = faiss.IndexFlatIP(dimension)
-            faiss.normalize_L2(self.knowledge_embeddings)
-            self.vector_index.add(self.knowledge_embeddings)
+        # The trained index already holds the vectors; mmap it rather than rebuilding
+        self.vector_index = self._place_index(self._read_index(filepath + '.faiss'))
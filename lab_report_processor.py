@@ -8,103 +8,242 @@ from PIL import Image
 import cv2
 import numpy as np
 import re
-from typing import Dict, List, Optional, Tuple
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
 import io
+import os
 import base64
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from cache import LRUCache
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
+
+# Pages at least this tall are split into row bands that are OCR'd in parallel
+OCR_BAND_MIN_HEIGHT = 500
+OCR_BANDS = 8
+
+# Biomarker name, value and unit patterns, in the order results are reported
+BIOMARKER_PATTERNS = {
+    'hemoglobin': r'(?:hemoglobin|hb|hgb)[\s:]*(?P<hemoglobin_val>\d+\.?\d*)\s*(?:g/dl|g/dL)',
+    'glucose': r'(?:glucose|glu)[\s:]*(?P<glucose_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'hba1c': r'(?:hba1c|hb a1c|glycated hemoglobin)[\s:]*(?P<hba1c_val>\d+\.?\d*)\s*(?:%|percent)',
+    'total_cholesterol': r'(?:total cholesterol|chol)[\s:]*(?P<total_cholesterol_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'ldl': r'(?:ldl|lld cholesterol)[\s:]*(?P<ldl_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'hdl': r'(?:hdl|hld cholesterol)[\s:]*(?P<hdl_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'triglycerides': r'(?:triglycerides|tg)[\s:]*(?P<triglycerides_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'tsh': r'(?:tsh|thyroid stimulating hormone)[\s:]*(?P<tsh_val>\d+\.?\d*)\s*(?:mIU/L|mIU/ml|uIU/mL)',
+    't3': r'(?:t3|triiodothyronine)[\s:]*(?P<t3_val>\d+\.?\d*)\s*(?:ng/dl|ng/dL)',
+    't4': r'(?:t4|thyroxine|free t4)[\s:]*(?P<t4_val>\d+\.?\d*)\s*(?:ng/dl|ng/dL)',
+    'creatinine': r'(?:creatinine|creat)[\s:]*(?P<creatinine_val>\d+\.?\d*)\s*(?:mg/dl|mg/dL)',
+    'vitamin_d': r'(?:vitamin d|25-oh vitamin d|25ohd)[\s:]*(?P<vitamin_d_val>\d+\.?\d*)\s*(?:ng/ml|ng/mL)',
+    'crp': r'(?:crp|c-reactive protein)[\s:]*(?P<crp_val>\d+\.?\d*)\s*(?:mg/l|mg/L)',
+    'esr': r'(?:esr|erythrocyte sedimentation rate)[\s:]*(?P<esr_val>\d+\.?\d*)\s*(?:mm/hr|mm/h)',
+    'wbc': r'(?:wbc|white blood cells|leukocytes)[\s:]*(?P<wbc_val>\d+\.?\d*)\s*(?:/ul|/μL|10e9/L)',
+    'rbc': r'(?:rbc|red blood cells|erythrocytes)[\s:]*(?P<rbc_val>\d+\.?\d*)\s*(?:million/ul|million/μL)',
+    'platelets': r'(?:platelets|plt)[\s:]*(?P<platelets_val>\d+\.?\d*)\s*(?:/ul|/μL|thousand/ul)',
+    'mcv': r'(?:mcv|mean corpuscular volume)[\s:]*(?P<mcv_val>\d+\.?\d*)\s*(?:fl|fL)',
+    'iron': r'(?:serum iron|iron)[\s:]*(?P<iron_val>\d+\.?\d*)\s*(?:μg/dl|mcg/dl|ug/dl)',
+    'ferritin': r'(?:ferritin)[\s:]*(?P<ferritin_val>\d+\.?\d*)\s*(?:ng/ml|ng/mL)'
+}
+
+# Every pattern as a named group inside a lookahead, so one case-insensitive
+# scan of the text finds the matches of all biomarkers, overlapping or not.
+# Compiled once at import rather than per processor instance
+FUSED_BIOMARKER_PATTERN = re.compile(
+    '(?=' + '|'.join(f"(?P<{name}>{pattern})" for name, pattern in BIOMARKER_PATTERNS.items()) + ')',
+    re.IGNORECASE
+)
 
 class LabReportProcessor:
     def __init__(self):
-        self.biomarker_patterns = {
-            'hemoglobin': r'(?i)(hemoglobin|hb|hgb)[\s:]*(\d+\.?\d*)\s*(g/dl|g/dL)',
-            'glucose': r'(?i)(glucose|glu)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'hba1c': r'(?i)(hba1c|hb a1c|glycated hemoglobin)[\s:]*(\d+\.?\d*)\s*(%|percent)',
-            'total_cholesterol': r'(?i)(total cholesterol|chol)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'ldl': r'(?i)(ldl|lld cholesterol)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'hdl': r'(?i)(hdl|hld cholesterol)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'triglycerides': r'(?i)(triglycerides|tg)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'tsh': r'(?i)(tsh|thyroid stimulating hormone)[\s:]*(\d+\.?\d*)\s*(mIU/L|mIU/ml|uIU/mL)',
-            't3': r'(?i)(t3|triiodothyronine)[\s:]*(\d+\.?\d*)\s*(ng/dl|ng/dL)',
-            't4': r'(?i)(t4|thyroxine|free t4)[\s:]*(\d+\.?\d*)\s*(ng/dl|ng/dL)',
-            'creatinine': r'(?i)(creatinine|creat)[\s:]*(\d+\.?\d*)\s*(mg/dl|mg/dL)',
-            'vitamin_d': r'(?i)(vitamin d|25-oh vitamin d|25ohd)[\s:]*(\d+\.?\d*)\s*(ng/ml|ng/mL)',
-            'crp': r'(?i)(crp|c-reactive protein)[\s:]*(\d+\.?\d*)\s*(mg/l|mg/L)',
-            'esr': r'(?i)(esr|erythrocyte sedimentation rate)[\s:]*(\d+\.?\d*)\s*(mm/hr|mm/h)',
-            'wbc': r'(?i)(wbc|white blood cells|leukocytes)[\s:]*(\d+\.?\d*)\s*(/ul|/μL|10e9/L)',
-            'rbc': r'(?i)(rbc|red blood cells|erythrocytes)[\s:]*(\d+\.?\d*)\s*(million/ul|million/μL)',
-            'platelets': r'(?i)(platelets|plt)[\s:]*(\d+\.?\d*)\s*(/ul|/μL|thousand/ul)',
-            'mcv': r'(?i)(mcv|mean corpuscular volume)[\s:]*(\d+\.?\d*)\s*(fl|fL)',
-            'iron': r'(?i)(serum iron|iron)[\s:]*(\d+\.?\d*)\s*(μg/dl|mcg/dl|ug/dl)',
-            'ferritin': r'(?i)(ferritin)[\s:]*(\d+\.?\d*)\s*(ng/ml|ng/mL)'
+        self.biomarker_patterns = BIOMARKER_PATTERNS
+        
+        # Extraction results keyed by a hash of the uploaded bytes, so resubmitted files skip OCR
+        self._extraction_cache = LRUCache(128)
+        
+        # Each band runs in its own single-threaded tesseract process; threads only wait on them.
+        # Concurrent uploads share this pool, so there is at most one tesseract per core
+        self._ocr_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+        
+        # Define reasonable ranges for validation
+        self.validation_ranges = {
+            'hemoglobin': (6.0, 20.0),
+            'glucose': (50.0, 500.0),
+            'hba1c': (3.0, 15.0),
+            'total_cholesterol': (100.0, 500.0),
+            'ldl': (50.0, 300.0),
+            'hdl': (20.0, 100.0),
+            'triglycerides': (50.0, 1000.0),
+            'tsh': (0.1, 50.0),
+            't3': (50.0, 300.0),
+            't4': (0.5, 20.0),
+            'creatinine': (0.3, 10.0),
+            'vitamin_d': (5.0, 150.0),
+            'crp': (0.1, 50.0),
+            'esr': (1.0, 100.0),
+            'wbc': (1.0, 50.0),
+            'rbc': (2.0, 8.0),
+            'platelets': (50.0, 1000.0),
+            'mcv': (60.0, 120.0),
+            'iron': (20.0, 300.0),
+            'ferritin': (5.0, 1000.0)
         }
+        
+        # Bounds as aligned arrays so a whole report is range-checked in one vectorized compare
+        self._validation_index = {biomarker: i for i, biomarker in enumerate(self.validation_ranges)}
+        lows, highs = zip(*self.validation_ranges.values())
+        self._validation_lows = np.asarray(lows)
+        self._validation_highs = np.asarray(highs)
     
-    def process_pdf(self, pdf_content: bytes) -> Dict[str, float]:
-        """Extract biomarker data from PDF content"""
+    def process_pdf(self, pdf_content: Union[bytes, BinaryIO]) -> Dict[str, float]:
+        """Extract biomarker data from PDF content, given as bytes or a seekable binary file"""
+        pdf_content = self._as_stream(pdf_content)
+        key = self._content_key('pdf', pdf_content)
+        cached = self._extraction_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(pdf_content))
-            text = ""
-            
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-            
-            return self._extract_biomarkers_from_text(text)
+            text = self._extract_pdf_text(pdf_content)
+            biomarkers = self._extract_biomarkers_from_text(text)
         except Exception as e:
             print(f"Error processing PDF: {e}")
             return {}
+        
+        self._extraction_cache.put(key, biomarkers)
+        return dict(biomarkers)
+    
+    def _extract_pdf_text(self, pdf_content: BinaryIO) -> str:
+        """Extract the text of every page, using PDFium's native parser when it is installed"""
+        if pdfium is not None:
+            try:
+                pdf = pdfium.PdfDocument(pdf_content)
+                try:
+                    return "".join(page.get_textpage().get_text_range() + "\n" for page in pdf)
+                finally:
+                    pdf.close()
+            except pdfium.PdfiumError:
+                # Malformed PDFs PDFium rejects can still be read by PyPDF2
+                pdf_content.seek(0)
+        
+        pdf_reader = PyPDF2.PdfReader(pdf_content)
+        return "".join(page.extract_text() + "\n" for page in pdf_reader.pages)
     
-    def process_image(self, image_content: bytes) -> Dict[str, float]:
-        """Extract biomarker data from image content using OCR"""
+    def process_image(self, image_content: Union[bytes, BinaryIO]) -> Dict[str, float]:
+        """Extract biomarker data from image content using OCR, given as bytes or a seekable binary file"""
+        image_content = self._as_stream(image_content)
+        key = self._content_key('image', image_content)
+        cached = self._extraction_cache.get(key)
+        if cached is not None:
+            return dict(cached)
+        
         try:
-            # Load image
-            image = Image.open(io.BytesIO(image_content))
-            
-            # Convert to OpenCV format
-            cv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            # Load image straight into grayscale; OCR never needs the color channels
+            image = Image.open(image_content).convert('L')
+            gray = np.asarray(image)
             
             # Preprocess image for better OCR
-            processed_image = self._preprocess_image_for_ocr(cv_image)
+            processed_image = self._preprocess_image_for_ocr(gray)
             
             # Perform OCR
-            text = pytesseract.image_to_string(processed_image)
+            text = self._ocr_image(processed_image)
             
-            return self._extract_biomarkers_from_text(text)
+            biomarkers = self._extract_biomarkers_from_text(text)
         except Exception as e:
             print(f"Error processing image: {e}")
             return {}
+        
+        self._extraction_cache.put(key, biomarkers)
+        return dict(biomarkers)
+    
+    @staticmethod
+    def _as_stream(content: Union[bytes, BinaryIO]) -> BinaryIO:
+        """Wrap raw bytes so uploads and in-memory content are read the same way"""
+        return io.BytesIO(content) if isinstance(content, (bytes, bytearray)) else content
+    
+    @staticmethod
+    def _content_key(kind: str, stream: BinaryIO) -> Tuple[str, bytes]:
+        """Cache key for an upload: its kind plus a BLAKE3 (or BLAKE2b) digest of the bytes"""
+        hasher = blake3() if blake3 is not None else hashlib.blake2b(digest_size=32)
+        stream.seek(0)
+        # Hash in chunks so a large spooled upload is never copied into one bytes object
+        for chunk in iter(lambda: stream.read(1 << 20), b''):
+            hasher.update(chunk)
+        stream.seek(0)
+        return kind, hasher.digest()
+    
+    def _ocr_image(self, image: np.ndarray) -> str:
+        """OCR a binarized page, reading tall pages as row bands in parallel"""
+        if image.shape[0] < OCR_BAND_MIN_HEIGHT:
+            return pytesseract.image_to_string(image)
+        
+        bands = self._split_into_bands(image)
+        texts = self._ocr_executor.map(self._ocr_band, bands)
+        return "\n".join(texts)
+    
+    @staticmethod
+    def _ocr_band(band: np.ndarray) -> str:
+        """OCR one band in a tesseract process limited to a single OpenMP thread"""
+        # pytesseract always passes the parent environment, so the band process is run directly
+        _, png = cv2.imencode('.png', band)
+        result = subprocess.run(
+            [pytesseract.pytesseract.tesseract_cmd, 'stdin', 'stdout', '--psm', '6'],
+            input=png.tobytes(),
+            capture_output=True,
+            env=dict(os.environ, OMP_THREAD_LIMIT='1')
+        )
+        if result.returncode != 0:
+            raise pytesseract.TesseractError(result.returncode, result.stderr.decode(errors='replace'))
+        return result.stdout.decode('utf-8', errors='replace')
     
-    def _preprocess_image_for_ocr(self, image: np.ndarray) -> np.ndarray:
-        """Preprocess image to improve OCR accuracy"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    def _split_into_bands(self, image: np.ndarray) -> List[np.ndarray]:
+        """Cut a page into about OCR_BANDS horizontal bands along blank pixel rows"""
+        height = image.shape[0]
+        # Text is black (0) on white after binarization, so blank rows have no zero pixels
+        blank_rows = np.flatnonzero(np.count_nonzero(image == 0, axis=1) == 0)
+        if blank_rows.size == 0:
+            return [image]
         
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
+        cuts = []
+        for band in range(1, OCR_BANDS):
+            # Cut at the blank row nearest an even split so no line of text is sliced
+            target = band * height // OCR_BANDS
+            cut = int(blank_rows[np.abs(blank_rows - target).argmin()])
+            if 0 < cut < height and (not cuts or cut > cuts[-1]):
+                cuts.append(cut)
+        
+        return np.split(image, cuts)
+    
+    def _preprocess_image_for_ocr(self, gray: np.ndarray) -> np.ndarray:
+        """Preprocess a grayscale image to improve OCR accuracy"""
+        # Median blur removes speckle noise in one integer pass
+        blurred = cv2.medianBlur(gray, 3)
         
         # Apply threshold to get binary image
         _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
         
-        # Morphological operations to clean up the image
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
-        
-        return cleaned
+        return thresh
     
     def _extract_biomarkers_from_text(self, text: str) -> Dict[str, float]:
         """Extract biomarker values from text using regex patterns"""
-        biomarkers = {}
+        found = {}
         
-        for biomarker_name, pattern in self.biomarker_patterns.items():
-            matches = re.findall(pattern, text)
-            
-            if matches:
-                # Take the first match
-                match = matches[0]
-                try:
-                    value = float(match[1])
-                    biomarkers[biomarker_name] = value
-                except (ValueError, IndexError):
-                    continue
+        for match in FUSED_BIOMARKER_PATTERN.finditer(text):
+            biomarker_name = match.lastgroup
+            if biomarker_name not in found:
+                # Keep the first match for each biomarker
+                found[biomarker_name] = float(match.group(f"{biomarker_name}_val"))
         
-        return biomarkers
+        return {name: found[name] for name in BIOMARKER_PATTERNS if name in found}
     
     def process_base64_file(self, base64_content: str, file_type: str) -> Dict[str, float]:
         """Process base64 encoded file content"""
@@ -127,34 +266,16 @@ class LabReportProcessor:
         """Validate and categorize biomarker values"""
         validated = {}
         
-        # Define reasonable ranges for validation
-        validation_ranges = {
-            'hemoglobin': (6.0, 20.0),
-            'glucose': (50.0, 500.0),
-            'hba1c': (3.0, 15.0),
-            'total_cholesterol': (100.0, 500.0),
-            'ldl': (50.0, 300.0),
-            'hdl': (20.0, 100.0),
-            'triglycerides': (50.0, 1000.0),
-            'tsh': (0.1, 50.0),
-            't3': (50.0, 300.0),
-            't4': (0.5, 20.0),
-            'creatinine': (0.3, 10.0),
-            'vitamin_d': (5.0, 150.0),
-            'crp': (0.1, 50.0),
-            'esr': (1.0, 100.0),
-            'wbc': (1.0, 50.0),
-            'rbc': (2.0, 8.0),
-            'platelets': (50.0, 1000.0),
-            'mcv': (60.0, 120.0),
-            'iron': (20.0, 300.0),
-            'ferritin': (5.0, 1000.0)
-        }
+        known = [biomarker for biomarker in biomarkers if biomarker in self._validation_index]
+        idx = np.fromiter((self._validation_index[biomarker] for biomarker in known), dtype=np.intp, count=len(known))
+        values = np.fromiter((biomarkers[biomarker] for biomarker in known), dtype=float, count=len(known))
+        within = (values >= self._validation_lows[idx]) & (values <= self._validation_highs[idx])
+        within_range = dict(zip(known, within.tolist()))
         
         for biomarker, value in biomarkers.items():
-            if biomarker in validation_ranges:
-                min_val, max_val = validation_ranges[biomarker]
-                if min_val <= value <= max_val:
+            if biomarker in within_range:
+                min_val, max_val = self.validation_ranges[biomarker]
+                if within_range[biomarker]:
                     validated[biomarker] = {
                         'value': value,
                         'status': 'valid',
@@ -2,19 +2,23 @@
 FastAPI application for AskYourDoc - Medical Lab Report Analysis with RAG
 """
 
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
+import asyncio
 import base64
+import hashlib
 import json
 import os
-from pathlib import Path
+import re
 
-from knowledge_base import MedicalKnowledgeBase
-from lab_report_processor import LabReportProcessor
-from health_analyzer import HealthAnalyzer
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -32,6 +36,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Responses that only change when the server restarts may be cached, but must be revalidated
+STATIC_CACHE_CONTROL = "public, max-age=3600, must-revalidate"
+
+# Uploads larger than this are rejected before processing
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+
+# Leading bytes of each accepted upload format; the client's filename and content type are not trusted.
+# A BMP header is 'BM', the 4-byte file size, then 4 reserved bytes that are always zero
+FILE_SIGNATURES = (
+    (re.compile(rb'%PDF-'), 'pdf'),
+    (re.compile(rb'\x89PNG\r\n\x1a\n'), 'image'),
+    (re.compile(rb'\xff\xd8\xff'), 'image'),
+    (re.compile(rb'BM.{4}\x00{4}', re.DOTALL), 'image'),
+    (re.compile(rb'II\*\x00'), 'image'),
+    (re.compile(rb'MM\x00\*'), 'image'),
+)
+
 # Global variables for components
 knowledge_base = None
 lab_processor = None
@@ -48,6 +69,10 @@ class HealthAnalysisResponse(BaseModel):
     analysis: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    top_k: int = 5
+
 class KnowledgeBaseStatus(BaseModel):
     loaded: bool
     datasets_count: int
@@ -55,12 +80,95 @@ class KnowledgeBaseStatus(BaseModel):
     abnormalities_count: int
     embeddings_ready: bool
 
+def render_json(content: Any) -> bytes:
+    """Serialize a response body to JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(jsonable_encoder(content)).encode('utf-8')
+
+def compute_etag(payload: bytes) -> str:
+    """Strong entity tag for a rendered response body"""
+    return f'"{hashlib.blake2b(payload, digest_size=16).hexdigest()}"'
+
+def cacheable_response(request: Request, payload: bytes, etag: str) -> Response:
+    """Serve a rendered body with validators, or 304 when the client's copy is current"""
+    headers = {"ETag": etag, "Cache-Control": STATIC_CACHE_CONTROL}
+    if_none_match = request.headers.get("if-none-match", "")
+    client_tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    if etag in client_tags or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    return Response(payload, media_type="application/json", headers=headers)
+
+async def sniff_upload(file: UploadFile) -> str:
+    """Classify an upload as 'pdf' or 'image' from its size and magic bytes"""
+    # The spooled body is complete by now; measure it rather than trust file.size, which chunked uploads may omit
+    file.file.seek(0, os.SEEK_END)
+    size = file.file.tell()
+    file.file.seek(0)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit")
+    
+    head = await file.read(16)
+    await file.seek(0)
+    for signature, kind in FILE_SIGNATURES:
+        if signature.match(head):
+            return kind
+    raise HTTPException(status_code=400, detail="Unsupported file type")
+
+def build_static_payloads():
+    """Pre-render the responses that cannot change once the knowledge base is loaded"""
+    app.state.status_payload = render_json(jsonable_encoder(KnowledgeBaseStatus(
+        loaded=True,
+        datasets_count=len(knowledge_base.datasets),
+        reference_ranges_count=len(knowledge_base.reference_ranges),
+        abnormalities_count=len(knowledge_base.abnormalities_mapping),
+        embeddings_ready=knowledge_base.vector_index is not None
+    )))
+    app.state.status_etag = compute_etag(app.state.status_payload)
+    
+    app.state.reference_ranges_payload = render_json({
+        "reference_ranges": knowledge_base.reference_ranges,
+        "abnormalities_mapping": knowledge_base.abnormalities_mapping
+    })
+    app.state.reference_ranges_etag = compute_etag(app.state.reference_ranges_payload)
+    
+    dataset_info = {}
+    for name, df in knowledge_base.datasets.items():
+        dataset_info[name] = {
+            "rows": len(df),
+            "columns": list(df.columns),
+            "sample_data": df.head(3).to_dict('records') if len(df) > 0 else []
+        }
+    
+    app.state.datasets_payload = render_json({
+        "datasets": dataset_info,
+        "total_datasets": len(knowledge_base.datasets)
+    })
+    app.state.datasets_etag = compute_etag(app.state.datasets_payload)
+
+def needs_contextual_knowledge(biomarker_data: Dict[str, float]) -> bool:
+    """Only reports with a value outside, or without, a reference range need retrieved context"""
+    return not all(knowledge_base.is_within_range(biomarker, value) for biomarker, value in biomarker_data.items())
+
+async def warm_up_knowledge_base():
+    """Load the encoder and page in the index in the background so the first request is not cold"""
+    try:
+        await asyncio.to_thread(knowledge_base.warm_up)
+        print("🔥 Knowledge base warmed up")
+    except Exception as e:
+        print(f"⚠️ Knowledge base warm-up failed: {e}")
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize the knowledge base and other components on startup"""
     global knowledge_base, lab_processor, health_analyzer
     
     try:
+        # Imported here rather than at module level so importing main skips pandas, OpenCV and the OCR stack
+        from knowledge_base import MedicalKnowledgeBase
+        from lab_report_processor import LabReportProcessor
+        from health_analyzer import HealthAnalyzer
+        
         # Initialize knowledge base
         knowledge_base = MedicalKnowledgeBase()
         knowledge_base.load_datasets()
@@ -70,6 +178,7 @@ async def startup_event():
         # Initialize other components
         lab_processor = LabReportProcessor()
         health_analyzer = HealthAnalyzer(knowledge_base)
+        build_static_payloads()
         
         print("✅ AskYourDoc system initialized successfully")
         print(f"📊 Loaded {len(knowledge_base.datasets)} datasets")
@@ -77,6 +186,9 @@ async def startup_event():
         print(f"🔍 Loaded {len(knowledge_base.abnormalities_mapping)} abnormality mappings")
         print(f"🧠 Created {len(knowledge_base.knowledge_texts)} knowledge embeddings")
         
+        # Keep a reference so the task is not garbage collected before it finishes
+        app.state.warmup_task = asyncio.create_task(warm_up_knowledge_base())
+        
     except Exception as e:
         print(f"❌ Error initializing system: {e}")
         raise e
@@ -96,18 +208,12 @@ async def health_check():
     return {"status": "healthy", "timestamp": "2024-01-01T00:00:00Z"}
 
 @app.get("/knowledge-base/status", response_model=KnowledgeBaseStatus)
-async def get_knowledge_base_status():
+async def get_knowledge_base_status(request: Request):
     """Get knowledge base status"""
     if not knowledge_base:
         raise HTTPException(status_code=503, detail="Knowledge base not initialized")
     
-    return KnowledgeBaseStatus(
-        loaded=True,
-        datasets_count=len(knowledge_base.datasets),
-        reference_ranges_count=len(knowledge_base.reference_ranges),
-        abnormalities_count=len(knowledge_base.abnormalities_mapping),
-        embeddings_ready=knowledge_base.vector_index is not None
-    )
+    return cacheable_response(request, app.state.status_payload, app.state.status_etag)
 
 @app.post("/analyze/lab-report")
 async def analyze_lab_report(
@@ -121,40 +227,40 @@ async def analyze_lab_report(
     if not lab_processor or not health_analyzer:
         raise HTTPException(status_code=503, detail="System not initialized")
     
+    # Reject oversized uploads and unrecognised formats before any parsing or OCR
+    file_kind = await sniff_upload(file)
+    
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Determine file type
-        file_extension = Path(file.filename).suffix.lower()
+        # Hand the spooled upload to the processor instead of reading it all into memory
+        file_content = file.file
         
-        # Process the file
-        if file_extension == '.pdf':
-            biomarker_data = lab_processor.process_pdf(file_content)
-        elif file_extension in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-            biomarker_data = lab_processor.process_image(file_content)
+        # Process the file off the event loop; OCR and PDF parsing are CPU-bound
+        if file_kind == 'pdf':
+            biomarker_data = await asyncio.to_thread(lab_processor.process_pdf, file_content)
         else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+            biomarker_data = await asyncio.to_thread(lab_processor.process_image, file_content)
         
         if not biomarker_data:
             raise HTTPException(status_code=400, detail="No biomarker data found in the file")
         
-        # Validate biomarker values
-        validated_data = lab_processor.validate_biomarker_values(biomarker_data)
-        
-        # Perform health analysis
-        analysis = health_analyzer.analyze_health_report(
-            biomarker_data=biomarker_data,
-            user_symptoms=user_symptoms,
-            user_lifestyle=user_lifestyle
+        # Validate biomarker values while the health analysis runs
+        validated_data, analysis = await asyncio.gather(
+            asyncio.to_thread(lab_processor.validate_biomarker_values, biomarker_data),
+            asyncio.to_thread(
+                health_analyzer.analyze_health_report,
+                biomarker_data=biomarker_data,
+                user_symptoms=user_symptoms,
+                user_lifestyle=user_lifestyle,
+                retrieve_context=needs_contextual_knowledge(biomarker_data)
+            )
         )
         
-        return JSONResponse(content={
+        return Response(render_json({
             "success": True,
             "analysis": analysis,
             "extracted_biomarkers": biomarker_data,
             "validation": validated_data
-        })
+        }), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing lab report: {str(e)}")
@@ -168,11 +274,13 @@ async def analyze_biomarkers(request: HealthAnalysisRequest):
         raise HTTPException(status_code=503, detail="System not initialized")
     
     try:
-        # Perform health analysis
-        analysis = health_analyzer.analyze_health_report(
+        # Perform health analysis off the event loop
+        analysis = await asyncio.to_thread(
+            health_analyzer.analyze_health_report,
             biomarker_data=request.biomarker_data,
             user_symptoms=request.user_symptoms or "",
-            user_lifestyle=request.user_lifestyle or ""
+            user_lifestyle=request.user_lifestyle or "",
+            retrieve_context=needs_contextual_knowledge(request.biomarker_data)
         )
         
         return HealthAnalysisResponse(
@@ -194,47 +302,42 @@ async def extract_biomarkers(file: UploadFile = File(...)):
     if not lab_processor:
         raise HTTPException(status_code=503, detail="System not initialized")
     
+    # Reject oversized uploads and unrecognised formats before any parsing or OCR
+    file_kind = await sniff_upload(file)
+    
     try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Determine file type
-        file_extension = Path(file.filename).suffix.lower()
+        # Hand the spooled upload to the processor instead of reading it all into memory
+        file_content = file.file
         
-        # Process the file
-        if file_extension == '.pdf':
-            biomarker_data = lab_processor.process_pdf(file_content)
-        elif file_extension in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']:
-            biomarker_data = lab_processor.process_image(file_content)
+        # Process the file off the event loop; OCR and PDF parsing are CPU-bound
+        if file_kind == 'pdf':
+            biomarker_data = await asyncio.to_thread(lab_processor.process_pdf, file_content)
         else:
-            raise HTTPException(status_code=400, detail="Unsupported file type")
+            biomarker_data = await asyncio.to_thread(lab_processor.process_image, file_content)
         
         # Validate biomarker values
         validated_data = lab_processor.validate_biomarker_values(biomarker_data)
         
-        return JSONResponse(content={
+        return Response(render_json({
             "success": True,
             "biomarkers": biomarker_data,
             "validation": validated_data,
             "summary": lab_processor.get_extraction_summary(biomarker_data)
-        })
+        }), media_type="application/json")
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error extracting biomarkers: {str(e)}")
 
 @app.get("/reference-ranges")
-async def get_reference_ranges():
+async def get_reference_ranges(request: Request):
     """Get all available reference ranges"""
     if not knowledge_base:
         raise HTTPException(status_code=503, detail="Knowledge base not initialized")
     
-    return {
-        "reference_ranges": knowledge_base.reference_ranges,
-        "abnormalities_mapping": knowledge_base.abnormalities_mapping
-    }
+    return cacheable_response(request, app.state.reference_ranges_payload, app.state.reference_ranges_etag)
 
 @app.get("/reference-ranges/{biomarker}")
-async def get_biomarker_reference_range(biomarker: str):
+async def get_biomarker_reference_range(biomarker: str, request: Request):
     """Get reference range for a specific biomarker"""
     if not knowledge_base:
         raise HTTPException(status_code=503, detail="Knowledge base not initialized")
@@ -243,45 +346,60 @@ async def get_biomarker_reference_range(biomarker: str):
     if not reference_range:
         raise HTTPException(status_code=404, detail=f"Reference range not found for {biomarker}")
     
-    return {
+    payload = render_json({
         "biomarker": biomarker,
         "reference_range": reference_range
-    }
+    })
+    return cacheable_response(request, payload, compute_etag(payload))
 
 @app.post("/search-knowledge")
-async def search_knowledge(query: str, top_k: int = 5):
-    """Search the knowledge base for relevant information"""
+async def search_knowledge(query: str, top_k: int = 5, mode: str = "vector"):
+    """Search the knowledge base; mode "hybrid" fuses BM25 keyword ranking with vector similarity"""
     if not knowledge_base:
         raise HTTPException(status_code=503, detail="Knowledge base not initialized")
+    if mode not in ("vector", "hybrid"):
+        raise HTTPException(status_code=400, detail=f"Unknown search mode '{mode}'; use 'vector' or 'hybrid'")
     
     try:
-        results = knowledge_base.retrieve_contextual_knowledge(query, top_k)
+        # Encoding, index search and a cold-start index load all block, so they run off the event loop
+        search = knowledge_base.hybrid_search if mode == "hybrid" else knowledge_base.retrieve_contextual_knowledge
+        results = await asyncio.to_thread(search, query, top_k)
         return {
             "query": query,
+            "mode": mode,
             "results": results,
             "count": len(results)
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error searching knowledge base: {str(e)}")
 
-@app.get("/datasets")
-async def get_datasets():
-    """Get information about loaded datasets"""
+@app.post("/search-knowledge/batch")
+async def search_knowledge_batch(request: BatchSearchRequest):
+    """Search the knowledge base for several queries with one embedding batch"""
     if not knowledge_base:
         raise HTTPException(status_code=503, detail="Knowledge base not initialized")
     
-    dataset_info = {}
-    for name, df in knowledge_base.datasets.items():
-        dataset_info[name] = {
-            "rows": len(df),
-            "columns": list(df.columns),
-            "sample_data": df.head(3).to_dict('records') if len(df) > 0 else []
+    try:
+        batch_results = await asyncio.to_thread(
+            knowledge_base.retrieve_contextual_knowledge_batch, request.queries, request.top_k
+        )
+        return {
+            "results": [
+                {"query": query, "results": results, "count": len(results)}
+                for query, results in zip(request.queries, batch_results)
+            ],
+            "count": len(batch_results)
         }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching knowledge base: {str(e)}")
+
+@app.get("/datasets")
+async def get_datasets(request: Request):
+    """Get information about loaded datasets"""
+    if not knowledge_base:
+        raise HTTPException(status_code=503, detail="Knowledge base not initialized")
     
-    return {
-        "datasets": dataset_info,
-        "total_datasets": len(knowledge_base.datasets)
-    }
+    return cacheable_response(request, app.state.datasets_payload, app.state.datasets_etag)
 
 if __name__ == "__main__":
     import uvicorn
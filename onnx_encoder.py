@@ -0,0 +1,71 @@
+"""
+Int8-quantized ONNX sentence encoder for CPU inference, used in place of SentenceTransformer when
+onnxruntime, optimum and transformers are installed
+"""
+
+import numpy as np
+import torch
+from pathlib import Path
+from typing import List
+
+try:
+    from onnxruntime import InferenceSession, SessionOptions, GraphOptimizationLevel
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+    from optimum.onnxruntime import ORTModelForFeatureExtraction
+    from transformers import AutoTokenizer
+    ONNX_AVAILABLE = True
+except ImportError:
+    ONNX_AVAILABLE = False
+
+class QuantizedSentenceEncoder:
+    """Mean-pooled sentence embeddings from a dynamically int8-quantized ONNX export"""
+    
+    def __init__(self, model_name: str, model_dir: Path, max_length: int = 256):
+        model_dir = Path(model_dir)
+        quantized_path = model_dir / 'model_int8.onnx'
+        
+        # Export and quantize once; later runs load the int8 graph straight from disk
+        if not quantized_path.exists():
+            model = ORTModelForFeatureExtraction.from_pretrained(model_name, export=True)
+            model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(model_dir)
+            quantize_dynamic(str(model_dir / 'model.onnx'), str(quantized_path), weight_type=QuantType.QInt8)
+        
+        options = SessionOptions()
+        options.graph_optimization_level = GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = InferenceSession(str(quantized_path), options, providers=['CPUExecutionProvider'])
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.max_length = max_length
+    
+    def encode(self, sentences: List[str], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, convert_to_tensor: bool = False,
+               normalize_embeddings: bool = False):
+        """Encode sentences with the same call signature as SentenceTransformer.encode"""
+        # Batch similar lengths together to keep padding to a minimum
+        order = np.argsort([-len(sentence) for sentence in sentences], kind='stable')
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            batch = [sentences[i] for i in order[start:start + batch_size]]
+            batches.append(self._encode_batch(batch))
+        
+        if not batches:
+            return torch.zeros((0, 0)) if convert_to_tensor else np.zeros((0, 0), dtype='float32')
+        embeddings = np.concatenate(batches)[np.argsort(order)].astype('float32')
+        
+        if normalize_embeddings:
+            norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+            embeddings /= np.maximum(norms, 1e-12)
+        
+        if convert_to_tensor:
+            return torch.from_numpy(embeddings)
+        return embeddings
+    
+    def _encode_batch(self, batch: List[str]) -> np.ndarray:
+        """Run one padded batch through the ONNX session and mean-pool over real tokens"""
+        tokens = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_length, return_tensors='np')
+        inputs = {name: tokens[name].astype('int64') for name in self.input_names if name in tokens}
+        token_embeddings = self.session.run(None, inputs)[0]
+        
+        mask = tokens['attention_mask'][..., None].astype('float32')
+        return (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
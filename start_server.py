@@ -5,21 +5,20 @@ Startup script for AskYourDoc server
 import uvicorn
 import sys
 import os
+from importlib.util import find_spec
 from pathlib import Path
 
 def check_dependencies():
     """Check if all required dependencies are installed"""
-    required_packages = [
-        'fastapi', 'uvicorn', 'pandas', 'numpy', 'scikit-learn',
-        'sentence_transformers', 'faiss-cpu', 'PyPDF2', 'pytesseract'
-    ]
+    # Package names as pip knows them, mapped to the module each one installs
+    required_packages = {
+        'fastapi': 'fastapi', 'uvicorn': 'uvicorn', 'pandas': 'pandas', 'numpy': 'numpy',
+        'scikit-learn': 'sklearn', 'sentence_transformers': 'sentence_transformers',
+        'faiss-cpu': 'faiss', 'PyPDF2': 'PyPDF2', 'pytesseract': 'pytesseract'
+    }
     
-    missing_packages = []
-    for package in required_packages:
-        try:
-            __import__(package.replace('-', '_'))
-        except ImportError:
-            missing_packages.append(package)
+    # find_spec only locates each module; importing torch-backed packages here would add seconds to startup
+    missing_packages = [package for package, module in required_packages.items() if find_spec(module) is None]
     
     if missing_packages:
         print("❌ Missing required packages:")
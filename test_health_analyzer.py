@@ -0,0 +1,61 @@
+"""
+Offline unit tests for health analysis helpers
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("health_analyzer")
+from health_analyzer import HealthAnalyzer
+from knowledge_base import MedicalKnowledgeBase
+
+BATCH_BIOMARKERS = ['glucose', 'tsh', 'hdl', 'creatinine', 'crp']
+
+@pytest.fixture
+def analyzer():
+    return HealthAnalyzer(MedicalKnowledgeBase())
+
+def patient_matrix(patients: int) -> np.ndarray:
+    """Random values straddling each critical threshold, with exact hits and unmeasured (NaN) entries"""
+    rng = np.random.default_rng(0)
+    thresholds = np.array([HealthAnalyzer.CRITICAL_THRESHOLDS.get(name, 60.0) for name in BATCH_BIOMARKERS])
+    values = np.round(thresholds * rng.uniform(0.5, 1.5, size=(patients, len(BATCH_BIOMARKERS))), 1)
+    values[::3, 0] = thresholds[0]
+    values[::4, 1] = thresholds[1]
+    values[rng.uniform(size=values.shape) < 0.2] = np.nan
+    return values
+
+def test_critical_findings_batch_paths_agree(analyzer):
+    """The kernel path on a large batch matches the per-patient dict path, NaNs included"""
+    values = patient_matrix(4 * HealthAnalyzer.BATCH_KERNEL_MIN_PATIENTS)
+    
+    expected = [
+        analyzer._identify_critical_findings({name: value for name, value in zip(BATCH_BIOMARKERS, row) if not np.isnan(value)})
+        for row in values
+    ]
+    assert any(expected) and not all(expected)
+    assert analyzer.identify_critical_findings_batch(BATCH_BIOMARKERS, values) == expected
+    
+    small = values[:HealthAnalyzer.BATCH_KERNEL_MIN_PATIENTS]
+    assert analyzer.identify_critical_findings_batch(BATCH_BIOMARKERS, small) == expected[:len(small)]
+
+def test_critical_findings_batch_skips_unmeasured(analyzer):
+    values = np.full((2 * HealthAnalyzer.BATCH_KERNEL_MIN_PATIENTS, len(BATCH_BIOMARKERS)), np.nan)
+    assert analyzer.identify_critical_findings_batch(BATCH_BIOMARKERS, values) == [[]] * len(values)
+
+REPORT = {'glucose': 320.0, 'tsh': 6.2, 'hdl': 45.0}
+
+def test_cached_analysis_is_isolated_and_restamped(analyzer):
+    """Cache hits are deep copies with a fresh timestamp, so callers cannot corrupt the cache"""
+    first = analyzer.analyze_health_report(dict(REPORT), "tired", "desk job", retrieve_context=False)
+    assert first['pillar_4_actionable_recommendations']['immediate_actions']
+    first['pillar_4_actionable_recommendations']['immediate_actions'].append('mutated by caller')
+    
+    second = analyzer.analyze_health_report(dict(REPORT), "tired", "desk job", retrieve_context=False)
+    assert second['timestamp'] > first['timestamp']
+    assert 'mutated by caller' not in second['pillar_4_actionable_recommendations']['immediate_actions']
+    
+    second['pillar_4_actionable_recommendations']['immediate_actions'].clear()
+    third = analyzer.analyze_health_report(dict(REPORT), "tired", "desk job", retrieve_context=False)
+    assert third['pillar_4_actionable_recommendations']['immediate_actions'] == first['pillar_4_actionable_recommendations']['immediate_actions'][:-1]
+    assert len(analyzer._analysis_cache) == 1
@@ -0,0 +1,291 @@
+"""
+Offline unit tests for knowledge base retrieval and parsing, using a stub sentence encoder
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+from knowledge_base import MedicalKnowledgeBase, BM25_K1, BM25_B, RRF_K, INDEX_FILE_PATTERN
+
+class StubEncoder:
+    """Stands in for SentenceTransformer: fixed vectors per text, unknown texts get their own axis"""
+    
+    class _Tensor:
+        def __init__(self, array):
+            self.array = array
+        
+        def cpu(self):
+            return self
+        
+        def numpy(self):
+            return self.array
+    
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.encoded = []
+    
+    def encode(self, texts, batch_size=32, show_progress_bar=False, convert_to_tensor=False, normalize_embeddings=False):
+        """Look up each text's vector, normalized as the real encoder would"""
+        self.encoded.extend(texts)
+        dimension = len(next(iter(self.vectors.values())))
+        fallback = np.eye(dimension)[-1]
+        embeddings = np.array([self.vectors.get(text, fallback) for text in texts], dtype='float32')
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return self._Tensor(embeddings) if convert_to_tensor else embeddings
+
+def make_kb(tmp_path, texts, vectors):
+    """Knowledge base over the given texts with the stub encoder and a freshly built index"""
+    kb = MedicalKnowledgeBase(data_dir=str(tmp_path))
+    kb.__dict__['embedding_model'] = StubEncoder(vectors)
+    kb.knowledge_texts = [{'text': text, 'type': 'test', 'source': 'test'} for text in texts]
+    kb._build_keyword_index()
+    kb.vector_index = kb._build_vector_index(kb._encode(texts))
+    return kb
+
+# Vector similarity to "marker" ranks alpha > gamma > zeta; BM25 ranks zeta > gamma and skips alpha
+RRF_TEXTS = ["alpha", "zeta marker marker", "gamma marker delta epsilon"]
+RRF_VECTORS = {
+    "marker": [1.0, 0.0, 0.0, 0.0],
+    "alpha": [1.0, 0.0, 0.0, 0.0],
+    "zeta marker marker": [0.5, 0.0, 0.866, 0.0],
+    "gamma marker delta epsilon": [0.8, 0.6, 0.0, 0.0],
+}
+
+@pytest.fixture
+def rrf_kb(tmp_path):
+    return make_kb(tmp_path, RRF_TEXTS, RRF_VECTORS)
+
+def bm25_score(kb, query, doc_id):
+    """Okapi BM25 computed directly from the token lists, as a reference for the inverted index"""
+    documents = [kb._name_tokens(item['text']) for item in kb.knowledge_texts]
+    average_length = sum(map(len, documents)) / len(documents)
+    score = 0.0
+    for term in kb._name_tokens(query):
+        containing = sum(term in document for document in documents)
+        if containing:
+            idf = math.log(1 + (len(documents) - containing + 0.5) / (containing + 0.5))
+            frequency = documents[doc_id].count(term)
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * len(documents[doc_id]) / average_length)
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+    return score
+
+def test_bm25_ranks_tiny_corpus(tmp_path):
+    """Repeated and rarer terms rank higher; documents without any query term are left out"""
+    texts = ["glucose glucose insulin", "glucose cholesterol ldl hdl", "thyroid tsh"]
+    kb = make_kb(tmp_path, texts, {text: [1.0, 0.0] for text in texts})
+    
+    assert kb._keyword_search("glucose", 5).tolist() == [0, 1]
+    assert kb._keyword_search("insulin glucose", 5).tolist() == [0, 1]
+    assert kb._keyword_search("TSH", 5).tolist() == [2]
+    assert kb._keyword_search("glucose", 1).tolist() == [0]
+
+def test_bm25_weights_match_okapi_formula(tmp_path):
+    texts = ["glucose glucose insulin", "glucose cholesterol ldl hdl", "thyroid tsh"]
+    kb = make_kb(tmp_path, texts, {text: [1.0, 0.0] for text in texts})
+    
+    for query in ["glucose", "glucose tsh", "cholesterol insulin"]:
+        scores = np.zeros(len(texts))
+        for term in kb._name_tokens(query):
+            if term in kb._keyword_postings:
+                ids, weights = kb._keyword_postings[term]
+                scores[ids] += weights
+        assert np.allclose(scores, [bm25_score(kb, query, i) for i in range(len(texts))])
+
+def test_rrf_prefers_entry_both_rankings_agree_on(rrf_kb):
+    """Each list puts a different entry first; the one both rank second wins the fusion"""
+    assert rrf_kb._keyword_search("marker", 2).tolist() == [1, 2]
+    
+    results = rrf_kb.hybrid_search("marker", top_k=1)
+    assert [result['text'] for result in results] == ["gamma marker delta epsilon"]
+    assert results[0]['relevance_score'] == pytest.approx(2 / (RRF_K + 2))
+
+def test_rrf_full_ordering(rrf_kb):
+    results = rrf_kb.hybrid_search("marker", top_k=3)
+    
+    # zeta: keyword 1st + vector 3rd; gamma: 2nd in both; alpha: vector 1st only
+    assert [result['text'] for result in results] == ["zeta marker marker", "gamma marker delta epsilon", "alpha"]
+    scores = [result['relevance_score'] for result in results]
+    assert scores == sorted(scores, reverse=True)
+
+def test_top_k_larger_than_corpus(rrf_kb):
+    """Asking for more entries than exist returns each entry once"""
+    hybrid = rrf_kb.hybrid_search("marker", top_k=10)
+    assert sorted(result['text'] for result in hybrid) == sorted(RRF_TEXTS)
+    
+    vector = rrf_kb.retrieve_contextual_knowledge("marker", top_k=10)
+    assert sorted(result['text'] for result in vector) == sorted(RRF_TEXTS)
+
+def test_empty_query(rrf_kb):
+    """An empty query has no keyword hits, so hybrid search falls back to the vector ranking"""
+    assert rrf_kb._keyword_search("", 5).size == 0
+    assert rrf_kb._match_reference_ranges("") == []
+    
+    results = rrf_kb.hybrid_search("", top_k=2)
+    assert len(results) == 2
+    assert len({result['text'] for result in results}) == 2
+
+def test_reference_range_matches_come_first(rrf_kb):
+    rrf_kb.reference_ranges = {'TSH': '0.4-4.5 mIU/L', 'LDL Cholesterol': '<100 mg/dL'}
+    rrf_kb._index_reference_ranges()
+    
+    results = rrf_kb.hybrid_search("ldl cholesterol and tsh marker", top_k=3)
+    assert [result.get('biomarker') for result in results[:2]] == ['LDL Cholesterol', 'TSH']
+    assert results[2]['type'] == 'test'
+
+def test_parse_reference_ranges_json_and_line_fallback():
+    kb = MedicalKnowledgeBase()
+    kb._parse_reference_ranges('{"TSH": "0.4-4.5 mIU/L", "Glucose": "70-100 mg/dL"}')
+    assert kb.reference_ranges == {"TSH": "0.4-4.5 mIU/L", "Glucose": "70-100 mg/dL"}
+    
+    kb = MedicalKnowledgeBase()
+    kb._parse_reference_ranges('{\n  "TSH": "0.4-4.5 mIU/L",\n  "Glucose": "70-100 mg/dL",\n')
+    assert kb.reference_ranges == {"TSH": "0.4-4.5 mIU/L", "Glucose": "70-100 mg/dL"}
+
+def test_parse_abnormalities_mapping():
+    kb = MedicalKnowledgeBase()
+    kb._parse_abnormalities_mapping('rows = [\n    ("TSH", "Hypothyroidism", "5%"),\n    ("TSH", "Hyperthyroidism"),\n]\n')
+    assert kb.get_abnormalities_for_biomarker('TSH') == [
+        {'condition': 'Hypothyroidism', 'prevalence': '5%'},
+        {'condition': 'Hyperthyroidism', 'prevalence': ''},
+    ]
+
+@pytest.mark.parametrize("range_info, expected", [
+    ("70-100 mg/dL", (70.0, 100.0)),
+    ("Male: 13.5-17.5 g/dL", (13.5, 17.5)),
+    ("< 200 mg/dL", (-np.inf, np.nextafter(200.0, -np.inf))),
+    ("> 40 mg/dL", (np.nextafter(40.0, np.inf), np.inf)),
+])
+def test_parse_range(range_info, expected):
+    assert MedicalKnowledgeBase._parse_range(range_info) == expected
+
+def test_parse_range_unparseable():
+    assert all(np.isnan(MedicalKnowledgeBase._parse_range("varies by lab")))
+
+def test_one_sided_range_boundaries():
+    kb = MedicalKnowledgeBase()
+    assert kb._classify_value(200.0, "< 200 mg/dL") == "High"
+    assert kb._classify_value(199.9, "< 200 mg/dL") == "Normal"
+    assert kb._classify_value(40.0, "> 40 mg/dL") == "Low"
+    assert kb._classify_value(55.0, "varies by lab") == "Unknown"
+
+def test_classify_values_matches_scalar_classification():
+    """The array path agrees with _classify_value, including unparseable and unknown biomarkers"""
+    kb = MedicalKnowledgeBase()
+    kb.reference_ranges = {'TSH': '0.4-4.5 mIU/L', 'LDL': '<100 mg/dL', 'HDL': '>40 mg/dL', 'Odd': 'see notes'}
+    kb._index_reference_ranges()
+    
+    biomarkers = ['TSH', 'TSH', 'TSH', 'LDL', 'LDL', 'HDL', 'HDL', 'Odd', 'Missing']
+    values = [0.2, 3.0, 4.5, 100.0, 80.0, 40.0, 55.0, 1.0, 1.0]
+    expected = [kb._classify_value(value, kb.reference_ranges.get(biomarker, '')) for biomarker, value in zip(biomarkers, values)]
+    assert expected == ['Low', 'Normal', 'Normal', 'High', 'Normal', 'Low', 'Normal', 'Unknown', 'Unknown']
+    assert kb.classify_values(biomarkers, values).tolist() == expected
+    
+    assert [kb.is_within_range(biomarker, value) for biomarker, value in zip(biomarkers, values)] == [status == 'Normal' for status in expected]
+
+class OtherBackendEncoder(StubEncoder):
+    """Same vectors under a different backend name, like int8 ONNX versus fp32 SentenceTransformer"""
+
+def corpus_kb(data_dir, texts, encoder):
+    """Knowledge base whose corpus is built from the given texts when _ensure_index runs"""
+    kb = MedicalKnowledgeBase(data_dir=str(data_dir))
+    kb.__dict__['embedding_model'] = encoder
+    kb.corpus_builds = 0
+    
+    def create_knowledge_texts():
+        kb.corpus_builds += 1
+        kb.knowledge_texts = [{'text': text, 'type': 'test', 'source': 'test'} for text in texts]
+    
+    kb._create_knowledge_texts = create_knowledge_texts
+    return kb
+
+def test_persisted_index_is_reused(tmp_path):
+    """A second knowledge base over the same corpus and backend loads the index without encoding"""
+    first = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    first._ensure_index()
+    assert len(first.embedding_model.encoded) == len(RRF_TEXTS)
+    
+    index_files = sorted(path.name for path in tmp_path.iterdir())
+    assert index_files == [INDEX_FILE_PATTERN.format(first._corpus_key())]
+    
+    second = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    second._ensure_index()
+    assert second.embedding_model.encoded == []
+    assert second.vector_index.ntotal == len(RRF_TEXTS)
+    assert second.hybrid_search("marker", 3) == first.hybrid_search("marker", 3)
+
+def test_index_key_depends_on_encoder_backend(tmp_path):
+    """Vectors from one backend are never searched with query vectors from another"""
+    first = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    first._ensure_index()
+    
+    other = corpus_kb(tmp_path, RRF_TEXTS, OtherBackendEncoder(RRF_VECTORS))
+    other._ensure_index()
+    assert other._corpus_key() != first._corpus_key()
+    assert len(other.embedding_model.encoded) == len(RRF_TEXTS)
+
+def test_persist_sweeps_only_hash_named_files(tmp_path):
+    """Indexes and interrupted writes for older corpora are removed; user files are kept"""
+    for name in ['kb_0123456789abcdef.faiss', 'kb_0123456789abcdef.faiss.partial', 'kb_backup.faiss', 'kb_backup.json']:
+        (tmp_path / name).write_bytes(b'old')
+    
+    kb = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    kb._ensure_index()
+    
+    index_name = INDEX_FILE_PATTERN.format(kb._corpus_key())
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([index_name, 'kb_backup.faiss', 'kb_backup.json'])
+
+def test_corrupt_persisted_index_is_rebuilt(tmp_path):
+    kb = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    (tmp_path / INDEX_FILE_PATTERN.format(kb._corpus_key())).write_bytes(b'not an index')
+    
+    kb._ensure_index()
+    assert kb.vector_index.ntotal == len(RRF_TEXTS)
+    assert len(kb.embedding_model.encoded) == len(RRF_TEXTS)
+
+def test_empty_corpus_is_built_once(tmp_path):
+    """With nothing to index, later queries do not rebuild the corpus"""
+    kb = corpus_kb(tmp_path, [], StubEncoder(RRF_VECTORS))
+    
+    assert kb.hybrid_search("glucose", 3) == []
+    assert kb.retrieve_contextual_knowledge("glucose", 3) == []
+    assert kb.corpus_builds == 1
+    assert kb.vector_index is None
+
+def test_save_and_load_round_trip(tmp_path):
+    kb = corpus_kb(tmp_path, RRF_TEXTS, StubEncoder(RRF_VECTORS))
+    kb.save_knowledge_base(str(tmp_path / 'kb_backup'))
+    
+    loaded = MedicalKnowledgeBase(data_dir=str(tmp_path))
+    loaded.__dict__['embedding_model'] = StubEncoder(RRF_VECTORS)
+    loaded.load_knowledge_base(str(tmp_path / 'kb_backup'))
+    assert loaded.hybrid_search("marker", 3) == kb.hybrid_search("marker", 3)
+
+def test_save_without_index_writes_nothing(tmp_path):
+    """Saving an empty knowledge base fails up front instead of leaving a half-written save"""
+    kb = corpus_kb(tmp_path, [], StubEncoder(RRF_VECTORS))
+    
+    with pytest.raises(ValueError):
+        kb.save_knowledge_base(str(tmp_path / 'kb_backup'))
+    assert list(tmp_path.iterdir()) == []
+
+def test_query_embeddings_are_cached(rrf_kb):
+    """Repeated queries, differing only in case and spacing, are encoded once"""
+    encoder = rrf_kb.embedding_model
+    encoder.encoded.clear()
+    
+    first = rrf_kb.retrieve_contextual_knowledge("Marker", top_k=3)
+    again = rrf_kb.retrieve_contextual_knowledge("  marker ", top_k=3)
+    assert again == first
+    assert encoder.encoded == ["marker"]
+
+def test_batch_encodes_each_new_query_once(rrf_kb):
+    encoder = rrf_kb.embedding_model
+    rrf_kb._encode_queries(["alpha"])
+    encoder.encoded.clear()
+    
+    embeddings = rrf_kb._encode_queries(["marker", "ALPHA", "Marker", "zeta marker marker"])
+    assert encoder.encoded == ["marker", "zeta marker marker"]
+    assert np.array_equal(embeddings, rrf_kb._encode(["marker", "alpha", "marker", "zeta marker marker"]))
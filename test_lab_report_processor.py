@@ -0,0 +1,111 @@
+"""
+Offline unit tests for biomarker extraction and OCR band splitting
+"""
+
+import subprocess
+
+import numpy as np
+import pytest
+
+lab_report_processor = pytest.importorskip("lab_report_processor")
+from lab_report_processor import LabReportProcessor, OCR_BANDS
+
+@pytest.fixture
+def processor():
+    return LabReportProcessor()
+
+def test_fused_pattern_extracts_every_biomarker(processor):
+    """One scan finds each biomarker regardless of case, reported in pattern order"""
+    text = "TSH: 6.2 mIU/L\nGLUCOSE 110 mg/dL\nHbA1c: 5.8 %\nHemoglobin 13.5 g/dl\nVitamin D 18 ng/mL"
+    
+    values = processor._extract_biomarkers_from_text(text)
+    assert values == {'hemoglobin': 13.5, 'glucose': 110.0, 'hba1c': 5.8, 'tsh': 6.2, 'vitamin_d': 18.0}
+    assert list(values) == ['hemoglobin', 'glucose', 'hba1c', 'tsh', 'vitamin_d']
+
+def test_fused_pattern_keeps_first_match(processor):
+    text = "Glucose: 95 mg/dL (fasting)\nGlucose: 140 mg/dL (2h post-meal)"
+    assert processor._extract_biomarkers_from_text(text) == {'glucose': 95.0}
+
+def test_fused_pattern_ignores_values_without_units(processor):
+    assert processor._extract_biomarkers_from_text("Glucose: 95\nnothing else here") == {}
+    assert processor._extract_biomarkers_from_text("") == {}
+
+def test_split_into_bands_cuts_on_blank_rows(processor):
+    """Bands are cut only where a row has no text pixels, and together cover the page"""
+    page = np.full((800, 50), 255, dtype=np.uint8)
+    for top in range(10, 800, 40):
+        page[top:top + 20, 5:45] = 0
+    
+    bands = processor._split_into_bands(page)
+    assert 1 < len(bands) <= OCR_BANDS
+    assert sum(band.shape[0] for band in bands) == page.shape[0]
+    assert np.array_equal(np.vstack(bands), page)
+    
+    row = 0
+    for band in bands[:-1]:
+        row += band.shape[0]
+        assert not (page[row] == 0).any()
+
+def test_split_into_bands_without_blank_rows(processor):
+    page = np.zeros((800, 50), dtype=np.uint8)
+    page[:, 0] = 255
+    
+    bands = processor._split_into_bands(page)
+    assert len(bands) == 1 and bands[0] is page
+
+def test_ocr_band_runs_single_threaded_tesseract(processor, monkeypatch):
+    """Each band's tesseract gets OMP_THREAD_LIMIT=1 and the band as PNG on stdin"""
+    calls = []
+    
+    def fake_run(args, input, capture_output, env):
+        calls.append((args, input, env))
+        return subprocess.CompletedProcess(args, 0, stdout=b'Glucose: 95 mg/dL\n', stderr=b'')
+    
+    monkeypatch.setattr(lab_report_processor.subprocess, 'run', fake_run)
+    band = np.full((40, 50), 255, dtype=np.uint8)
+    
+    assert processor._ocr_band(band) == 'Glucose: 95 mg/dL\n'
+    (args, png, env), = calls
+    assert args[1:] == ['stdin', 'stdout', '--psm', '6']
+    assert png.startswith(b'\x89PNG')
+    assert env['OMP_THREAD_LIMIT'] == '1'
+
+def loop_validate(validation_ranges, biomarkers):
+    """The per-biomarker loop validate_biomarker_values used before it was vectorized"""
+    validated = {}
+    for biomarker, value in biomarkers.items():
+        if biomarker in validation_ranges:
+            min_val, max_val = validation_ranges[biomarker]
+            if min_val <= value <= max_val:
+                validated[biomarker] = {'value': value, 'status': 'valid', 'range': (min_val, max_val)}
+            else:
+                validated[biomarker] = {
+                    'value': value,
+                    'status': 'out_of_range',
+                    'range': (min_val, max_val),
+                    'note': f"Value {value} is outside typical range {min_val}-{max_val}"
+                }
+        else:
+            validated[biomarker] = {'value': value, 'status': 'unknown_range', 'note': 'No validation range defined'}
+    return validated
+
+@pytest.mark.parametrize("biomarkers", [
+    {},
+    {'glucose': 95.0, 'tsh': 60.0, 'hdl': 20.0, 'ferritin': 1000.0, 'hemoglobin': 5.9},
+    {'mystery_marker': 1.0, 'ldl': float('nan'), 'crp': 0.1, 'rbc': 8.01},
+])
+def test_vectorized_validation_matches_loop(processor, biomarkers):
+    """Same statuses, notes and key order as the loop, at the bounds and for NaN and unknown names"""
+    validated = processor.validate_biomarker_values(biomarkers)
+    expected = loop_validate(processor.validation_ranges, biomarkers)
+    
+    assert list(validated) == list(expected)
+    assert repr(validated) == repr(expected)
+
+def test_vectorized_validation_matches_loop_on_random_reports(processor):
+    rng = np.random.default_rng(0)
+    names = list(processor.validation_ranges)
+    for _ in range(50):
+        chosen = rng.choice(names, size=rng.integers(1, len(names)), replace=False)
+        biomarkers = {str(name): float(np.round(rng.uniform(0, 1.2 * processor.validation_ranges[name][1]), 1)) for name in chosen}
+        assert processor.validate_biomarker_values(biomarkers) == loop_validate(processor.validation_ranges, biomarkers)
@@ -0,0 +1,105 @@
+"""
+Offline unit tests for HTTP validators and upload sniffing in the API
+"""
+
+import asyncio
+import io
+import threading
+
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi import HTTPException, UploadFile
+from starlette.requests import Request
+
+main = pytest.importorskip("main")
+from main import MAX_UPLOAD_BYTES, STATIC_CACHE_CONTROL, cacheable_response, compute_etag, sniff_upload
+
+ETAG = '"abc123"'
+
+def make_request(if_none_match=None):
+    """Bare GET request carrying an optional If-None-Match header"""
+    headers = [] if if_none_match is None else [(b'if-none-match', if_none_match.encode())]
+    return Request({'type': 'http', 'method': 'GET', 'path': '/', 'headers': headers})
+
+def sniff(content: bytes) -> str:
+    """Run sniff_upload on an in-memory upload without a declared size"""
+    upload = UploadFile(io.BytesIO(content), filename="report")
+    kind = asyncio.run(sniff_upload(upload))
+    assert upload.file.tell() == 0
+    return kind
+
+def test_etag_match_returns_304():
+    response = cacheable_response(make_request(ETAG), b'{"loaded":true}', ETAG)
+    assert response.status_code == 304
+    assert response.body == b''
+    assert response.headers['etag'] == ETAG
+
+@pytest.mark.parametrize("if_none_match", ['W/"abc123"', '"other", "abc123"', '*'])
+def test_weak_listed_and_wildcard_tags_match(if_none_match):
+    assert cacheable_response(make_request(if_none_match), b'{}', ETAG).status_code == 304
+
+@pytest.mark.parametrize("if_none_match", [None, '"stale"'])
+def test_etag_mismatch_returns_body(if_none_match):
+    response = cacheable_response(make_request(if_none_match), b'{"loaded":true}', ETAG)
+    assert response.status_code == 200
+    assert response.body == b'{"loaded":true}'
+    assert response.headers['etag'] == ETAG
+    assert response.headers['cache-control'] == STATIC_CACHE_CONTROL
+
+def test_etag_follows_payload():
+    assert compute_etag(b'{"a":1}') == compute_etag(b'{"a":1}')
+    assert compute_etag(b'{"a":1}') != compute_etag(b'{"a":2}')
+    assert compute_etag(b'{}').startswith('"') and compute_etag(b'{}').endswith('"')
+
+@pytest.mark.parametrize("content, kind", [
+    (b'%PDF-1.7\n', 'pdf'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00', 'image'),
+    (b'\xff\xd8\xff\xe0\x00\x10JFIF', 'image'),
+    (b'BM\x36\x00\x0c\x00\x00\x00\x00\x00\x36\x00\x00\x00', 'image'),
+    (b'II*\x00\x08\x00', 'image'),
+    (b'MM\x00*\x00\x08', 'image'),
+])
+def test_sniff_upload_magic_bytes(content, kind):
+    assert sniff(content) == kind
+
+@pytest.mark.parametrize("content", [
+    b'',
+    b'PK\x03\x04',
+    b'plain text that claims to be a pdf',
+    b'BMI report: 24.5, within the healthy range',
+    b'BM\x36\x00',
+])
+def test_sniff_upload_rejects_unknown_types(content):
+    with pytest.raises(HTTPException) as error:
+        sniff(content)
+    assert error.value.status_code == 400
+
+def test_sniff_upload_measures_size_itself():
+    """The cap applies even when the client did not declare a size"""
+    with pytest.raises(HTTPException) as error:
+        sniff(b'%PDF-' + b'\x00' * MAX_UPLOAD_BYTES)
+    assert error.value.status_code == 413
+
+class ThreadRecordingKnowledgeBase:
+    """Knowledge base stand-in that records which thread each search runs on"""
+    
+    def __init__(self):
+        self.threads = {}
+    
+    def hybrid_search(self, query, top_k):
+        self.threads['hybrid'] = threading.current_thread()
+        return [{'text': query, 'relevance_score': 1.0}]
+    
+    def retrieve_contextual_knowledge(self, query, top_k):
+        self.threads['vector'] = threading.current_thread()
+        return [{'text': query, 'relevance_score': 1.0}]
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_search_runs_off_the_event_loop(monkeypatch, mode):
+    stub = ThreadRecordingKnowledgeBase()
+    monkeypatch.setattr(main, 'knowledge_base', stub)
+    
+    response = asyncio.run(main.search_knowledge("glucose", 3, mode))
+    assert response['mode'] == mode and response['count'] == 1
+    assert stub.threads[mode] is not threading.main_thread()
@@ -0,0 +1,46 @@
+"""
+Offline unit tests for the quantized ONNX encoder's batching, without loading a model
+"""
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnx_encoder")
+from onnx_encoder import QuantizedSentenceEncoder
+
+class RecordingEncoder(QuantizedSentenceEncoder):
+    """Encoder whose batches embed each sentence as (length, first character code), recording each batch"""
+    
+    def __init__(self):
+        self.batches = []
+    
+    def _encode_batch(self, batch):
+        self.batches.append(list(batch))
+        return np.array([[len(sentence), ord(sentence[0])] for sentence in batch], dtype='float32')
+
+SENTENCES = ["tsh", "glucose level is high", "ldl", "a much longer sentence about cholesterol", "crp", "hba1c of 5.8"]
+
+@pytest.mark.parametrize("batch_size", [1, 2, 4, 32])
+def test_embeddings_come_back_in_input_order(batch_size):
+    encoder = RecordingEncoder()
+    
+    embeddings = encoder.encode(SENTENCES, batch_size=batch_size)
+    expected = np.array([[len(sentence), ord(sentence[0])] for sentence in SENTENCES], dtype='float32')
+    assert np.array_equal(embeddings, expected)
+    assert embeddings.dtype == np.float32
+
+def test_batches_group_similar_lengths():
+    """Sentences are batched longest first, so each batch pads to a similar length"""
+    encoder = RecordingEncoder()
+    
+    encoder.encode(SENTENCES, batch_size=2)
+    lengths = [len(sentence) for batch in encoder.batches for sentence in batch]
+    assert lengths == sorted(lengths, reverse=True)
+    assert [len(batch) for batch in encoder.batches] == [2, 2, 2]
+
+def test_normalized_and_empty_input():
+    encoder = RecordingEncoder()
+    
+    embeddings = encoder.encode(SENTENCES, batch_size=4, normalize_embeddings=True)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0)
+    assert encoder.encode([]).shape == (0, 0)
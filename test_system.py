@@ -1,11 +1,15 @@
 """
-Test script for AskYourDoc system
+Integration tests for the AskYourDoc API
+
+Start the server first (python main.py), then run:
+    pytest -n auto test_system.py
+
+The tests are skipped when the server is not running.
 """
 
-import json
-import requests
-import base64
-from pathlib import Path
+import pytest
+
+pytestmark = pytest.mark.integration
 
 # Test configuration
 BASE_URL = "http://localhost:8000"
@@ -20,179 +24,66 @@ TEST_BIOMARKERS = {
     "vitamin_d": 18.0
 }
 
-def test_knowledge_base_status():
+def test_knowledge_base_status(session):
     """Test knowledge base status endpoint"""
-    print("🔍 Testing Knowledge Base Status...")
-    try:
-        response = requests.get(f"{BASE_URL}/knowledge-base/status")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Knowledge Base Status: {data}")
-            return True
-        else:
-            print(f"❌ Knowledge Base Status failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Knowledge Base Status error: {e}")
-        return False
+    response = session.get(f"{BASE_URL}/knowledge-base/status")
+    assert response.status_code == 200, f"Knowledge Base Status failed: {response.status_code}"
+    assert response.json()['loaded']
 
-def test_reference_ranges():
+def test_reference_ranges(session):
     """Test reference ranges endpoint"""
-    print("\n📋 Testing Reference Ranges...")
-    try:
-        response = requests.get(f"{BASE_URL}/reference-ranges")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Reference Ranges loaded: {len(data['reference_ranges'])} ranges")
-            print(f"✅ Abnormality Mappings: {len(data['abnormalities_mapping'])} mappings")
-            return True
-        else:
-            print(f"❌ Reference Ranges failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Reference Ranges error: {e}")
-        return False
+    response = session.get(f"{BASE_URL}/reference-ranges")
+    assert response.status_code == 200, f"Reference Ranges failed: {response.status_code}"
+    
+    data = response.json()
+    assert data['reference_ranges'], "No reference ranges loaded"
+    assert 'abnormalities_mapping' in data
 
-def test_biomarker_analysis():
+def test_biomarker_analysis(session):
     """Test biomarker analysis endpoint"""
-    print("\n🧪 Testing Biomarker Analysis...")
-    try:
-        payload = {
-            "biomarker_data": TEST_BIOMARKERS,
-            "user_symptoms": "I've been feeling tired and gaining weight recently. I also have some joint pain.",
-            "user_lifestyle": "I work a desk job and don't exercise much. I eat mostly processed foods."
-        }
-        
-        response = requests.post(f"{BASE_URL}/analyze/biomarkers", json=payload)
-        if response.status_code == 200:
-            data = response.json()
-            if data['success']:
-                print("✅ Biomarker Analysis successful!")
-                print(f"📊 Analysis includes {len(data['analysis'])} main sections")
-                
-                # Print key insights
-                analysis = data['analysis']
-                print("\n📈 Key Insights:")
-                print(f"- Overall Risk Level: {analysis['pillar_3_predictive_insights']['overall_risk_level']}")
-                print(f"- Medical Consultation Required: {analysis['pillar_4_actionable_recommendations']['medical_consultation_required']}")
-                print(f"- Number of Risk Assessments: {len(analysis['pillar_3_predictive_insights']['risk_assessments'])}")
-                
-                return True
-            else:
-                print(f"❌ Biomarker Analysis failed: {data['error']}")
-                return False
-        else:
-            print(f"❌ Biomarker Analysis failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Biomarker Analysis error: {e}")
-        return False
-
-def test_knowledge_search():
-    """Test knowledge base search"""
-    print("\n🔍 Testing Knowledge Base Search...")
-    try:
-        queries = [
-            "TSH hypothyroidism",
-            "glucose diabetes risk",
-            "cholesterol cardiovascular disease"
-        ]
-        
-        for query in queries:
-            response = requests.post(f"{BASE_URL}/search-knowledge", params={"query": query, "top_k": 3})
-            if response.status_code == 200:
-                data = response.json()
-                print(f"✅ Search '{query}': {len(data['results'])} results")
-            else:
-                print(f"❌ Search '{query}' failed: {response.status_code}")
-        
-        return True
-    except Exception as e:
-        print(f"❌ Knowledge Search error: {e}")
-        return False
-
-def test_datasets():
-    """Test datasets endpoint"""
-    print("\n📊 Testing Datasets...")
-    try:
-        response = requests.get(f"{BASE_URL}/datasets")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Datasets loaded: {data['total_datasets']} datasets")
-            for name, info in data['datasets'].items():
-                print(f"  - {name}: {info['rows']} rows, {len(info['columns'])} columns")
-            return True
-        else:
-            print(f"❌ Datasets failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Datasets error: {e}")
-        return False
-
-def test_health_check():
-    """Test health check endpoint"""
-    print("\n🏥 Testing Health Check...")
-    try:
-        response = requests.get(f"{BASE_URL}/health")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"✅ Health Check: {data['status']}")
-            return True
-        else:
-            print(f"❌ Health Check failed: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Health Check error: {e}")
-        return False
-
-def run_all_tests():
-    """Run all tests"""
-    print("🚀 Starting AskYourDoc System Tests\n")
+    payload = {
+        "biomarker_data": TEST_BIOMARKERS,
+        "user_symptoms": "I've been feeling tired and gaining weight recently. I also have some joint pain.",
+        "user_lifestyle": "I work a desk job and don't exercise much. I eat mostly processed foods."
+    }
     
-    tests = [
-        ("Health Check", test_health_check),
-        ("Knowledge Base Status", test_knowledge_base_status),
-        ("Reference Ranges", test_reference_ranges),
-        ("Datasets", test_datasets),
-        ("Knowledge Search", test_knowledge_search),
-        ("Biomarker Analysis", test_biomarker_analysis),
-    ]
-    
-    results = []
-    for test_name, test_func in tests:
-        try:
-            result = test_func()
-            results.append((test_name, result))
-        except Exception as e:
-            print(f"❌ {test_name} crashed: {e}")
-            results.append((test_name, False))
-    
-    # Summary
-    print("\n" + "="*50)
-    print("📊 TEST SUMMARY")
-    print("="*50)
+    response = session.post(f"{BASE_URL}/analyze/biomarkers", json=payload)
+    assert response.status_code == 200, f"Biomarker Analysis failed: {response.status_code}"
     
-    passed = sum(1 for _, result in results if result)
-    total = len(results)
+    data = response.json()
+    assert data['success'], f"Biomarker Analysis failed: {data['error']}"
     
-    for test_name, result in results:
-        status = "✅ PASS" if result else "❌ FAIL"
-        print(f"{status} {test_name}")
-    
-    print(f"\n🎯 Overall: {passed}/{total} tests passed")
-    
-    if passed == total:
-        print("🎉 All tests passed! System is working correctly.")
-    else:
-        print("⚠️  Some tests failed. Check the logs above for details.")
+    # Key insights
+    analysis = data['analysis']
+    assert 'overall_risk_level' in analysis['pillar_3_predictive_insights']
+    assert 'risk_assessments' in analysis['pillar_3_predictive_insights']
+    assert 'medical_consultation_required' in analysis['pillar_4_actionable_recommendations']
+
+def test_knowledge_search(session):
+    """Test knowledge base search"""
+    queries = [
+        "TSH hypothyroidism",
+        "glucose diabetes risk",
+        "cholesterol cardiovascular disease"
+    ]
     
-    return passed == total
+    for query in queries:
+        response = session.post(f"{BASE_URL}/search-knowledge", params={"query": query, "top_k": 3})
+        assert response.status_code == 200, f"Search '{query}' failed: {response.status_code}"
+        assert len(response.json()['results']) <= 3
 
-if __name__ == "__main__":
-    print("AskYourDoc System Test Suite")
-    print("Make sure the server is running on http://localhost:8000")
-    print("Run: python main.py")
-    print()
+def test_datasets(session):
+    """Test datasets endpoint"""
+    response = session.get(f"{BASE_URL}/datasets")
+    assert response.status_code == 200, f"Datasets failed: {response.status_code}"
     
-    input("Press Enter to start tests...")
-    run_all_tests()
+    data = response.json()
+    assert data['total_datasets'] == len(data['datasets'])
+    for name, info in data['datasets'].items():
+        assert info['rows'] >= 0 and info['columns'], f"Dataset {name} has no columns"
+
+def test_health_check(session):
+    """Test health check endpoint"""
+    response = session.get(f"{BASE_URL}/health")
+    assert response.status_code == 200, f"Health Check failed: {response.status_code}"
+    assert response.json()['status'] == 'healthy'